@@ -1,28 +1,71 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict, Any, Tuple
-from ..core.database import Database
+import asyncio
+import hashlib
+import logging
+import orjson
+import re
+import threading
+from collections import OrderedDict
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import TypeAdapter
+from starlette.background import BackgroundTask
+from typing import List, Dict, Any, Optional, Tuple
+from ..core.database import Database, parse_server_args
 from ..models.schemas import (
     LLMConfigCreate, LLMConfig, LLMConfigUpdate, MCPServerCreate, MCPServer, MCPServerWithTools,
-    MCPServerToggle, ChatRequest, ChatResponse, ChatMessage, ToolCallRequest, ToolCallResponse
+    MCPServerToggle, ChatRequest, AgentChatRequest, ChatResponse, ChatMessage, ToolCallRequest, ToolCallResponse,
+    BatchToolCallRequest, BatchToolCallResponse
 )
-from ..services.mcp_client import mcp_client
+from ..services.mcp_client import mcp_client, MCP_MAX_CONCURRENCY
 from ..services.llm_service import LLMService
 from ..services.local_mcp_manager import local_mcp_manager
 from ..services.mcp_parameter_corrector import mcp_parameter_corrector
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-# Database dependency
-def get_db():
-    return Database()
+# Bounds MCP calls across all requests so fan-out can't exhaust the HTTP pool
+_mcp_sem: Optional[asyncio.Semaphore] = None
+
+def _mcp_semaphore() -> asyncio.Semaphore:
+    """Shared MCP call limit, created on first use so it binds to the server's event loop (Python 3.9)"""
+    global _mcp_sem
+    if _mcp_sem is None:
+        _mcp_sem = asyncio.Semaphore(MCP_MAX_CONCURRENCY)
+    return _mcp_sem
+
+# Database dependency - shared instance created in the app lifespan
+def get_db(request: Request) -> Database:
+    return request.app.state.db
+
+def get_server_by_id(server_id: int, db: Database = Depends(get_db)) -> Dict[str, Any]:
+    """Resolve the path's server_id to its row; cached by FastAPI for the request"""
+    server = db.get_mcp_server(server_id)
+    if not server:
+        raise HTTPException(status_code=404, detail="Server not found")
+    return server
+
+# List endpoints validate DB rows once and serialize them in pydantic-core,
+# skipping FastAPI's response_model revalidation and jsonable_encoder pass
+_LLM_CONFIGS_ADAPTER = TypeAdapter(List[LLMConfig])
+_MCP_SERVERS_ADAPTER = TypeAdapter(List[MCPServer])
+
+def _validated_json(adapter: TypeAdapter, rows: Any) -> Response:
+    return Response(content=adapter.dump_json(adapter.validate_python(rows)), media_type="application/json")
+
+# Prebuilt so liveness probes skip validation and JSON encoding entirely
+_HEALTH_RESPONSE = Response(content=b'{"status":"healthy"}', media_type="application/json")
 
 @router.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return _HEALTH_RESPONSE
+
+# Endpoints that only do blocking DB work are plain `def` so FastAPI runs them in its threadpool
 
 # LLM Configuration endpoints
 @router.post("/llm/config", response_model=Dict[str, Any])
-async def create_llm_config(config: LLMConfigCreate, db: Database = Depends(get_db)):
+def create_llm_config(config: LLMConfigCreate, db: Database = Depends(get_db)):
     try:
         config_id = db.add_llm_config(config.name, config.url, config.api_key, config.provider.value, config.model, config.max_tokens)
         return {"id": config_id, "message": "LLM configuration created successfully"}
@@ -30,16 +73,16 @@ async def create_llm_config(config: LLMConfigCreate, db: Database = Depends(get_
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/llm/configs", response_model=List[LLMConfig])
-async def get_llm_configs(db: Database = Depends(get_db)):
-    return db.get_llm_configs()
+def get_llm_configs(db: Database = Depends(get_db)):
+    return _validated_json(_LLM_CONFIGS_ADAPTER, db.get_llm_configs())
 
 @router.post("/llm/config/{config_id}/activate")
-async def activate_llm_config(config_id: int, db: Database = Depends(get_db)):
+def activate_llm_config(config_id: int, db: Database = Depends(get_db)):
     db.set_active_llm(config_id)
     return {"message": "LLM configuration activated"}
 
 @router.delete("/llm/config/{config_id}")
-async def delete_llm_config(config_id: int, db: Database = Depends(get_db)):
+def delete_llm_config(config_id: int, db: Database = Depends(get_db)):
     try:
         db.delete_llm_config(config_id)
         return {"message": "LLM configuration deleted successfully"}
@@ -47,7 +90,7 @@ async def delete_llm_config(config_id: int, db: Database = Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.put("/llm/config/{config_id}")
-async def update_llm_config(config_id: int, update: LLMConfigUpdate, db: Database = Depends(get_db)):
+def update_llm_config(config_id: int, update: LLMConfigUpdate, db: Database = Depends(get_db)):
     try:
         db.update_llm_max_tokens(config_id, update.max_tokens)
         return {"message": "LLM configuration updated successfully"}
@@ -57,40 +100,37 @@ async def update_llm_config(config_id: int, update: LLMConfigUpdate, db: Databas
 # MCP Server endpoints
 @router.post("/mcp/servers", response_model=Dict[str, Any])
 async def create_mcp_server(server: MCPServerCreate, db: Database = Depends(get_db)):
-    print(f"[DEBUG] POST /mcp/servers started - server_type: {server.server_type}, name: {server.name}")
+    logger.debug("POST /mcp/servers started - server_type: %s, name: %s", server.server_type, server.name)
     try:
         if server.server_type == 'local':
-            print(f"[DEBUG] Processing local server creation...")
+            logger.debug("Processing local server creation...")
             # Handle local server
             if not server.command:
                 raise HTTPException(status_code=400, detail="Command is required for local servers")
             
             # Validate command exists
-            print(f"[DEBUG] Validating command: {server.command}")
+            logger.debug("Validating command: %s", server.command)
             if not local_mcp_manager.validate_command(server.command):
                 error_msg = f"Command not found or not executable: {server.command}"
-                print(f"[DEBUG] Command validation failed: {error_msg}")
+                logger.debug("Command validation failed: %s", error_msg)
                 raise HTTPException(status_code=400, detail=error_msg)
-            print(f"[DEBUG] Command validation passed")
+            logger.debug("Command validation passed")
             
             # Add server to database
-            print(f"[DEBUG] Adding server to database...")
-            import json
-            args_json = json.dumps(server.args or [])
-            server_id = db.add_mcp_server(
+            logger.debug("Adding server to database...")
+            server_id = await db.aadd_mcp_server(
                 name=server.name,
                 server_type='local',
                 command=server.command,
-                args=args_json,
+                args=server.args or [],
                 auto_start=server.auto_start,
                 working_directory=server.working_directory
             )
-            print(f"[DEBUG] Server added to database with ID: {server_id}")
+            logger.debug("Server added to database with ID: %s", server_id)
             
             # TEMPORARILY DISABLE AUTO_START TO ISOLATE ISSUE
-            print(f"[DEBUG] Skipping auto_start (temporarily disabled for debugging)")
-            db.update_process_status(server_id, "stopped")
-            db.update_server_status(server_id, "stopped")
+            logger.debug("Skipping auto_start (temporarily disabled for debugging)")
+            await db.aupdate_server_states(server_id, "stopped", "stopped")
             
             return {"id": server_id, "message": "Local MCP server configured successfully"}
             
@@ -99,27 +139,31 @@ async def create_mcp_server(server: MCPServerCreate, db: Database = Depends(get_
             if not server.url:
                 raise HTTPException(status_code=400, detail="URL is required for remote servers")
                 
-            # Test connection first
-            connection_test = await mcp_client.test_connection(server.url, server.api_key)
-            if not connection_test:
+            # Test connection and discover tools in one round trip where the server allows it
+            try:
+                async with _mcp_semaphore():
+                    init_result, tools = await mcp_client.initialize_and_list(server.url, server.api_key)
+            except Exception:
+                init_result, tools = {}, []
+            if "protocolVersion" not in init_result.get("result", {}):
                 raise HTTPException(status_code=400, detail="Failed to connect to MCP server")
             
             # Add server to database
-            server_id = db.add_mcp_server(
+            server_id = await db.aadd_mcp_server(
                 name=server.name,
                 server_type='remote',
                 url=server.url,
                 api_key=server.api_key
             )
-            db.update_server_status(server_id, "connected")
             
-            # Discover and store tools
+            await db.aupdate_server_status(server_id, "connected")
+            
+            # Store discovered tools
             try:
-                tools = await mcp_client.list_tools(server.url, server.api_key)
                 if tools:
-                    db.add_mcp_tools(server_id, tools)
+                    await db.aadd_mcp_tools(server_id, tools)
             except Exception as e:
-                print(f"Failed to discover tools: {e}")
+                logger.warning("Failed to store discovered tools: %s", e)
             
             return {"id": server_id, "message": "MCP server connected successfully"}
             
@@ -129,89 +173,84 @@ async def create_mcp_server(server: MCPServerCreate, db: Database = Depends(get_
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/mcp/servers", response_model=List[MCPServer])
-async def get_mcp_servers(db: Database = Depends(get_db)):
-    return db.get_mcp_servers()
+def get_mcp_servers(db: Database = Depends(get_db)):
+    return _validated_json(_MCP_SERVERS_ADAPTER, db.get_mcp_servers())
 
 @router.get("/mcp/servers/{server_id}", response_model=MCPServerWithTools)
-async def get_mcp_server_with_tools(server_id: int, db: Database = Depends(get_db)):
-    servers = db.get_mcp_servers()
-    server = next((s for s in servers if s["id"] == server_id), None)
-    if not server:
-        raise HTTPException(status_code=404, detail="Server not found")
-    
+def get_mcp_server_with_tools(server_id: int, server: Dict[str, Any] = Depends(get_server_by_id), db: Database = Depends(get_db)):
     tools = db.get_server_tools(server_id)
-    return MCPServerWithTools(**server, tools=tools)
+    server_with_tools = MCPServerWithTools.model_validate({**server, "tools": tools})
+    return Response(content=server_with_tools.model_dump_json(), media_type="application/json")
 
 @router.post("/mcp/servers/{server_id}/toggle")
-async def toggle_mcp_server(server_id: int, toggle_data: MCPServerToggle, db: Database = Depends(get_db)):
+def toggle_mcp_server(server_id: int, toggle_data: MCPServerToggle, db: Database = Depends(get_db)):
     db.toggle_server_enabled(server_id, toggle_data.enabled)
     return {"message": f"Server {'enabled' if toggle_data.enabled else 'disabled'}"}
 
 @router.delete("/mcp/servers/{server_id}")
 async def delete_mcp_server(server_id: int, db: Database = Depends(get_db)):
     # Stop local server if it's running
-    servers = db.get_mcp_servers()
-    server = next((s for s in servers if s["id"] == server_id), None)
+    server = await db.aget_mcp_server(server_id)
     if server and server.get("server_type") == "local":
-        local_mcp_manager.stop_server(server_id)
+        await local_mcp_manager.stop_server(server_id)
     
-    db.delete_mcp_server(server_id)
+    await db.adelete_mcp_server(server_id)
     return {"message": "Server deleted successfully"}
 
 @router.post("/mcp/servers/{server_id}/start")
-async def start_local_server(server_id: int, db: Database = Depends(get_db)):
+async def start_local_server(server_id: int, server: Dict[str, Any] = Depends(get_server_by_id), db: Database = Depends(get_db)):
     try:
-        servers = db.get_mcp_servers()
-        server = next((s for s in servers if s["id"] == server_id), None)
-        if not server:
-            raise HTTPException(status_code=404, detail="Server not found")
-        
         if server["server_type"] != "local":
             raise HTTPException(status_code=400, detail="Only local servers can be started")
         
-        import json
-        args = json.loads(server.get("args", "[]"))
+        args = list(parse_server_args(server.get("args")))
         working_dir = server.get("working_directory")
         success = await local_mcp_manager.start_server(
             server_id, server["name"], server["command"], args, working_dir
         )
         
         if success:
-            db.update_process_status(server_id, "running")
-            db.update_server_status(server_id, "connected")
+            # Now perform MCP protocol handshake, recording the running state meanwhile
+            logger.debug("Starting MCP handshake for server %s", server_id)
+            status_update, init_result = await asyncio.gather(
+                db.aupdate_server_states(server_id, "running", "connected"),
+                mcp_client.initialize_local_connection(server_id),
+                return_exceptions=True
+            )
+            if isinstance(status_update, Exception):
+                raise status_update
             
-            # Now perform MCP protocol handshake and tool discovery
+            # Tool discovery
             try:
-                print(f"[DEBUG] Starting MCP handshake for server {server_id}")
-                
-                # Initialize connection
-                init_result = await mcp_client.initialize_local_connection(server_id)
-                print(f"[DEBUG] Initialize result: {init_result}")
+                if isinstance(init_result, Exception):
+                    raise init_result
+                logger.debug("Initialize result: %s", init_result)
                 
                 if init_result and "result" in init_result:
                     # Discover tools
-                    print(f"[DEBUG] Discovering tools for server {server_id}")
-                    tools = await mcp_client.list_local_tools(server_id)
-                    print(f"[DEBUG] Discovered {len(tools)} tools: {[t.get('name', 'unknown') for t in tools]}")
+                    logger.debug("Discovering tools for server %s", server_id)
+                    async with _mcp_semaphore():
+                        tools = await mcp_client.list_local_tools(server_id)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Discovered %d tools: %s", len(tools), [t.get('name', 'unknown') for t in tools])
                     
                     # Store tools in database
                     if tools:
-                        print(f"[DEBUG] Storing tools in database")
-                        db.add_mcp_tools(server_id, tools)
-                        print(f"[DEBUG] Tools stored successfully")
+                        logger.debug("Storing tools in database")
+                        await db.aadd_mcp_tools(server_id, tools)
+                        logger.debug("Tools stored successfully")
                     
                     return {"message": f"Server started successfully with {len(tools)} tools discovered"}
                 else:
-                    print(f"[DEBUG] MCP handshake failed, but server is running")
+                    logger.debug("MCP handshake failed, but server is running")
                     return {"message": "Server started but MCP handshake failed - check server logs"}
                     
             except Exception as e:
-                print(f"[DEBUG] Tool discovery failed: {str(e)}")
+                logger.debug("Tool discovery failed: %s", e)
                 # Server is running but tool discovery failed
                 return {"message": f"Server started but tool discovery failed: {str(e)}"}
         else:
-            db.update_process_status(server_id, "error")
-            db.update_server_status(server_id, "error")
+            await db.aupdate_server_states(server_id, "error", "error")
             raise HTTPException(status_code=500, detail="Failed to start server")
             
     except HTTPException:
@@ -220,21 +259,15 @@ async def start_local_server(server_id: int, db: Database = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/mcp/servers/{server_id}/stop")
-async def stop_local_server(server_id: int, db: Database = Depends(get_db)):
+async def stop_local_server(server_id: int, server: Dict[str, Any] = Depends(get_server_by_id), db: Database = Depends(get_db)):
     try:
-        servers = db.get_mcp_servers()
-        server = next((s for s in servers if s["id"] == server_id), None)
-        if not server:
-            raise HTTPException(status_code=404, detail="Server not found")
-        
         if server["server_type"] != "local":
             raise HTTPException(status_code=400, detail="Only local servers can be stopped")
         
-        success = local_mcp_manager.stop_server(server_id)
+        success = await local_mcp_manager.stop_server(server_id)
         
         if success:
-            db.update_process_status(server_id, "stopped")
-            db.update_server_status(server_id, "stopped")
+            await db.aupdate_server_states(server_id, "stopped", "stopped")
             return {"message": "Server stopped successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to stop server")
@@ -244,6 +277,16 @@ async def stop_local_server(server_id: int, db: Database = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _record_dead_servers(health_status: Dict[int, Dict[str, Any]], db: Database):
+    """Drop exited processes and persist their status; runs on the event loop after the health response is sent"""
+    local_mcp_manager.cleanup_dead_processes()
+    dead_servers = []
+    for server_id, health in health_status.items():
+        if not health.get('running', False):
+            crashed = health.get('status') == 'exited' and health.get('exit_code', 0) != 0
+            dead_servers.append((server_id, "stopped", "error" if crashed else "stopped"))
+    await db.aupdate_many_server_states(dead_servers)
+
 @router.get("/mcp/servers/health/all")
 async def get_all_servers_health(db: Database = Depends(get_db)):
     """Get health status of all local MCP servers."""
@@ -251,53 +294,34 @@ async def get_all_servers_health(db: Database = Depends(get_db)):
         # Get all server health
         health_status = local_mcp_manager.get_all_server_health()
         
-        # Clean up any dead processes
-        cleaned_count = local_mcp_manager.cleanup_dead_processes()
-        
-        # Update database status for dead processes
-        if cleaned_count > 0:
-            servers = db.get_mcp_servers()
-            for server in servers:
-                if server["server_type"] == "local" and server["id"] in health_status:
-                    health = health_status[server["id"]]
-                    if not health.get('running', False):
-                        db.update_process_status(server["id"], "stopped")
-                        db.update_server_status(server["id"], "error" if health.get('exit_code', 0) != 0 else "stopped")
+        # Dead processes are cleaned up and recorded in the background
+        cleaned_count = sum(1 for health in health_status.values() if not health.get('running', False))
+        background = BackgroundTask(_record_dead_servers, health_status, db) if cleaned_count else None
         
-        return {
+        return JSONResponse({
             "health_status": health_status,
             "cleaned_processes": cleaned_count
-        }
+        }, background=background)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/mcp/servers/{server_id}/health")
-async def get_server_health(server_id: int, db: Database = Depends(get_db)):
+async def get_server_health(server_id: int, server: Dict[str, Any] = Depends(get_server_by_id), db: Database = Depends(get_db)):
     """Get health status of a local MCP server."""
     try:
-        servers = db.get_mcp_servers()
-        server = next((s for s in servers if s["id"] == server_id), None)
-        if not server:
-            raise HTTPException(status_code=404, detail="Server not found")
-        
         if server["server_type"] != "local":
             raise HTTPException(status_code=400, detail="Health check only available for local servers")
         
         # Get health from LocalMCPManager
         health = local_mcp_manager.check_server_health(server_id)
         
-        # Clean up dead processes if needed and update database
+        # Clean up dead processes if needed and update database after responding
+        background = None
         if not health.get('running', False):
-            local_mcp_manager.cleanup_dead_processes()
-            # Update database status
-            db.update_process_status(server_id, "stopped")
-            if health.get('status') == 'exited' and health.get('exit_code', 0) != 0:
-                db.update_server_status(server_id, "error")
-            else:
-                db.update_server_status(server_id, "stopped")
+            background = BackgroundTask(_record_dead_servers, {server_id: health}, db)
         
-        return health
+        return JSONResponse(health, background=background)
         
     except HTTPException:
         raise
@@ -305,230 +329,404 @@ async def get_server_health(server_id: int, db: Database = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/mcp/tools/{tool_id}/toggle")
-async def toggle_mcp_tool(tool_id: int, enabled: bool, db: Database = Depends(get_db)):
+def toggle_mcp_tool(tool_id: int, enabled: bool, db: Database = Depends(get_db)):
     db.toggle_tool_enabled(tool_id, enabled)
     return {"message": f"Tool {'enabled' if enabled else 'disabled'}"}
 
 # Chat endpoints
+async def _resolve_llm_service(request: ChatRequest, db: Database) -> LLMService:
+    """Build the LLM service for the requested (or active) configuration"""
+    # Get LLM configuration - use specified ID or active config
+    if request.llm_config_id:
+        config = await db.aget_llm_config(request.llm_config_id)
+        if not config:
+            raise HTTPException(status_code=400, detail=f"LLM configuration {request.llm_config_id} not found")
+    else:
+        # Use active LLM configuration
+        config = await db.aget_active_llm_config()
+        if not config:
+            raise HTTPException(status_code=400, detail="No active LLM configuration found. Please configure and activate an LLM provider.")
+    
+    # Get LLM configuration with API key
+    config_with_key = await db.aget_llm_config_with_key(config["id"])
+    if not config_with_key:
+        raise HTTPException(status_code=400, detail="LLM configuration not found")
+    
+    if not config_with_key.get("api_key"):
+        raise HTTPException(status_code=400, detail="LLM configuration API key not found or is invalid. Please re-configure your API key in Settings.")
+    
+    # Building an SDK client on a cache miss loads SSL contexts / boto3 service
+    # models, so keep it off the event loop
+    return await asyncio.to_thread(
+        _get_llm_service,
+        provider=config["provider"],
+        api_key=config_with_key["api_key"],
+        model=config_with_key.get("model", "gpt-4o"),  # Use model from config_with_key
+        base_url=config["url"],
+        max_tokens=config_with_key.get("max_tokens", 16000)  # Use max_tokens from config
+    )
+
+# Recently used LLM services, keyed by a digest of the API key rather than the key itself
+_LLM_SERVICE_CACHE_SIZE = 16
+_llm_services: "OrderedDict[tuple, LLMService]" = OrderedDict()
+_llm_services_lock = threading.Lock()
+
+def _get_llm_service(provider: str, api_key: str, model: str, base_url: str, max_tokens: int) -> LLMService:
+    """Reuse LLM services, and with them their SDK clients' connection pools, across requests"""
+    key = (provider, hashlib.blake2b(api_key.encode(), digest_size=16).digest(), model, base_url, max_tokens)
+    with _llm_services_lock:
+        service = _llm_services.get(key)
+        if service is not None:
+            _llm_services.move_to_end(key)
+            return service
+    # Built outside the lock; a concurrent miss for the same key keeps the first one stored
+    service = LLMService(provider=provider, api_key=api_key, model=model, base_url=base_url, max_tokens=max_tokens)
+    with _llm_services_lock:
+        service = _llm_services.setdefault(key, service)
+        _llm_services.move_to_end(key)
+        while len(_llm_services) > _LLM_SERVICE_CACHE_SIZE:
+            _llm_services.popitem(last=False)
+    return service
+
+def clear_llm_services():
+    """Forget cached LLM services (called on application shutdown, with the HTTP pool they use)"""
+    with _llm_services_lock:
+        _llm_services.clear()
+
+# Last chat tool list from the database and the payload built from it
+_tools_payload_cache: Optional[Tuple[List[Dict[str, Any]], Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]]] = None
+
+async def _get_available_tools(db: Database) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Get enabled tools from connected MCP servers in OpenAI format, plus a tool name -> server map.
+    The database returns the same list until the tools change, so the payload is only rebuilt then;
+    callers must not mutate the result.
+    """
+    global _tools_payload_cache
+    tools = await db.aget_active_tools_for_chat()
+    cached = _tools_payload_cache
+    if cached and cached[0] is tools:
+        return cached[1]
+    available_tools = [
+        {
+            "type": "function",
+            "function": {
+                "name": tool["name"],
+                "description": tool.get("description", ""),
+                "parameters": tool["schema"]
+            }
+        }
+        for tool in tools
+    ]
+    tool_servers = {
+        tool["name"]: {"id": tool["server_id"], "server_type": tool["server_type"]}
+        for tool in tools
+    }
+    _tools_payload_cache = (tools, (available_tools, tool_servers))
+    return available_tools, tool_servers
+
+def _build_chat_messages(request: ChatRequest) -> List[ChatMessage]:
+    """Convert conversation history plus the new user message to ChatMessage objects"""
+    chat_messages = []
+    
+    # Inject system prompt if conversation doesn't already have one
+    has_system_message = any(
+        (getattr(msg, 'role', None) or msg.get('role', '')) == 'system'
+        for msg in request.conversation_history
+    )
+    if not has_system_message:
+        chat_messages.append(ChatMessage(
+            role="system",
+            content=(
+                "You are a helpful assistant with access to MCP tools. "
+                "Always use your tools to answer user questions — do not guess or describe what a query would look like. "
+                "When you receive tool results, analyze the data and present a clear, direct answer. "
+                "Prefer the 'platform_core_search' tool for data questions as it searches and returns results in one step. "
+                "If the first tool call doesn't fully answer the question, make additional tool calls as needed."
+            )
+        ))
+    
+    # History was validated when the request was parsed, so pass ChatMessages through
+    # as-is and only wrap raw dicts, without a second validation pass
+    chat_messages.extend(
+        msg if isinstance(msg, ChatMessage) else ChatMessage.model_construct(
+            role=msg.get("role", "user"),
+            content=msg.get("content", ""),
+            tool_calls=msg.get("tool_calls"),
+            tool_call_id=msg.get("tool_call_id")
+        )
+        for msg in request.conversation_history
+    )
+    
+    # Add the current user message
+    chat_messages.append(ChatMessage(
+        role="user",
+        content=request.message
+    ))
+    return chat_messages
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest, db: Database = Depends(get_db)):
     try:
-        print(f"[DEBUG] Chat request received:")
-        print(f"[DEBUG] Message: {request.message}")
-        print(f"[DEBUG] Conversation history length: {len(request.conversation_history)}")
-        for i, msg in enumerate(request.conversation_history):
-            print(f"[DEBUG] Message {i}: role={getattr(msg, 'role', 'unknown')}, content_length={len(getattr(msg, 'content', ''))}, tool_calls={getattr(msg, 'tool_calls', None)}, tool_call_id={getattr(msg, 'tool_call_id', None)}")
-        print(f"[DEBUG] LLM config ID: {request.llm_config_id}")
-        # Get LLM configuration - use specified ID or active config
-        llm_configs = db.get_llm_configs()
-        if request.llm_config_id:
-            config = next((c for c in llm_configs if c["id"] == request.llm_config_id), None)
-            if not config:
-                raise HTTPException(status_code=400, detail=f"LLM configuration {request.llm_config_id} not found")
-        else:
-            # Use active LLM configuration
-            config = next((c for c in llm_configs if c["is_active"]), None)
-            if not config:
-                raise HTTPException(status_code=400, detail="No active LLM configuration found. Please configure and activate an LLM provider.")
-        
-        # Get LLM configuration with API key
-        config_with_key = db.get_llm_config_with_key(config["id"])
-        if not config_with_key:
-            raise HTTPException(status_code=400, detail="LLM configuration not found")
-        
-        if not config_with_key.get("api_key"):
-            raise HTTPException(status_code=400, detail="LLM configuration API key not found or is invalid. Please re-configure your API key in Settings.")
-        
-        # Initialize LLM service
-        llm_service = LLMService(
-            provider=config["provider"],
-            api_key=config_with_key["api_key"],
-            model=config_with_key.get("model", "gpt-4o"),  # Use model from config_with_key
-            base_url=config["url"],
-            max_tokens=config_with_key.get("max_tokens", 16000)  # Use max_tokens from config
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Chat request received: message=%r, history_length=%d, llm_config_id=%s",
+                         request.message, len(request.conversation_history), request.llm_config_id)
+            for i, msg in enumerate(request.conversation_history):
+                logger.debug("Message %d: role=%s, content_length=%d, tool_calls=%s, tool_call_id=%s",
+                             i, getattr(msg, 'role', 'unknown'), len(getattr(msg, 'content', '')),
+                             getattr(msg, 'tool_calls', None), getattr(msg, 'tool_call_id', None))
+        llm_service = await _resolve_llm_service(request, db)
         
         # Get available tools from enabled MCP servers (unless excluded for final responses)
         available_tools = []
         if not request.exclude_tools:
-            print(f"[DEBUG] Including tools in LLM request")
-            servers = db.get_mcp_servers()
-            for server in servers:
-                if server["is_enabled"] and server["status"] == "connected":
-                    tools = db.get_server_tools(server["id"])
-                    for tool in tools:
-                        if tool["is_enabled"]:
-                            # Parse stored schema or use default
-                            try:
-                                import json
-                                schema = json.loads(tool.get("schema", "{}"))
-                                if not schema or not isinstance(schema, dict):
-                                    schema = {"type": "object", "properties": {}}
-                            except:
-                                schema = {"type": "object", "properties": {}}
-                            
-                            available_tools.append({
-                                "type": "function",
-                                "function": {
-                                    "name": tool["name"],
-                                    "description": tool.get("description", ""),
-                                    "parameters": schema
-                                }
-                            })
+            logger.debug("Including tools in LLM request")
+            available_tools, _ = await _get_available_tools(db)
         else:
-            print(f"[DEBUG] Excluding tools from LLM request (final response mode)")
+            logger.debug("Excluding tools from LLM request (final response mode)")
         
         # Generate response
-        # Convert conversation history to ChatMessage objects
-        chat_messages = []
-        
-        # Inject system prompt if conversation doesn't already have one
-        has_system_message = any(
-            (getattr(msg, 'role', None) or msg.get('role', '')) == 'system'
-            for msg in request.conversation_history
-        )
-        if not has_system_message:
-            chat_messages.append(ChatMessage(
-                role="system",
-                content=(
-                    "You are a helpful assistant with access to MCP tools. "
-                    "Always use your tools to answer user questions — do not guess or describe what a query would look like. "
-                    "When you receive tool results, analyze the data and present a clear, direct answer. "
-                    "Prefer the 'platform_core_search' tool for data questions as it searches and returns results in one step. "
-                    "If the first tool call doesn't fully answer the question, make additional tool calls as needed."
-                )
-            ))
-        
-        for msg in request.conversation_history:
-            # Handle both dict and ChatMessage objects
-            if isinstance(msg, dict):
-                chat_messages.append(ChatMessage(
-                    role=msg.get("role", "user"),
-                    content=msg.get("content", ""),
-                    tool_calls=msg.get("tool_calls")
-                ))
-            else:
-                # Already a ChatMessage object
-                chat_messages.append(msg)
-        
-        # Add the current user message
-        chat_messages.append(ChatMessage(
-            role="user",
-            content=request.message
-        ))
-        
+        chat_messages = _build_chat_messages(request)
         response = await llm_service.generate_response(chat_messages, available_tools if available_tools else None)
         
-        print(f"[DEBUG] LLM service response: {response}")
-        print(f"[DEBUG] Response type: {type(response)}")
-        print(f"[DEBUG] Response keys: {list(response.keys()) if isinstance(response, dict) else 'not a dict'}")
+        logger.debug("LLM service response: %s", response)
         
         # Handle case where LLM makes tool calls without content
         content = response.get("content") or ""
         tool_calls = response.get("tool_calls", [])
         
-        print(f"[DEBUG] Extracted content: '{content}' (length: {len(content)})")
-        print(f"[DEBUG] Extracted tool_calls: {tool_calls}")
-        
         chat_response = ChatResponse(
             response=content,
             tool_calls=tool_calls
         )
-        
-        print(f"[DEBUG] Final ChatResponse: {chat_response}")
-        return chat_response
+        # Serialize once with pydantic-core instead of jsonable_encoder + json.dumps
+        return Response(content=chat_response.model_dump_json(), media_type="application/json")
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Tool calling endpoint
-@router.post("/mcp/call-tool", response_model=ToolCallResponse)
-async def call_tool(request: ToolCallRequest, db: Database = Depends(get_db)):
-    async def _make_tool_call(params: Dict[str, Any]):
-        """Helper function to make the actual tool call"""
-        if server["server_type"] == "local":
+def _sse_event(event: str, data: Any) -> str:
+    """Format a server-sent event frame"""
+    return f"event: {event}\ndata: {orjson.dumps(data, default=str).decode()}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest, db: Database = Depends(get_db)):
+    """
+    Stream a chat response as server-sent events: token deltas, a tool_call
+    event (with its MCP server) as soon as each tool call is named, then the
+    assembled message and done.
+    """
+    llm_service = await _resolve_llm_service(request, db)
+    available_tools, tool_servers = ([], {}) if request.exclude_tools else await _get_available_tools(db)
+    chat_messages = _build_chat_messages(request)
+    
+    async def _events():
+        try:
+            async for event in llm_service.generate_response_stream(chat_messages, available_tools or None):
+                if event["type"] == "token":
+                    yield _sse_event("token", {"content": event["content"]})
+                elif event["type"] == "tool_call":
+                    # Lets the client start the tool call before generation finishes
+                    server = tool_servers.get(event["name"]) or {}
+                    yield _sse_event("tool_call", {
+                        "id": event["id"],
+                        "name": event["name"],
+                        "server_id": server.get("id"),
+                        "server_type": server.get("server_type")
+                    })
+                else:
+                    yield _sse_event("message", {"response": event["content"], "tool_calls": event["tool_calls"]})
+            yield _sse_event("done", {})
+        except Exception as e:
+            yield _sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(_events(), media_type="text/event-stream")
+
+async def _run_agent_tool_call(call: Dict[str, Any], tool_servers: Dict[str, Dict[str, Any]], db: Database) -> ToolCallResponse:
+    """Execute a tool call requested by the LLM during an agent loop"""
+    server = tool_servers.get(call["name"])
+    if not server:
+        return ToolCallResponse(success=False, result=None, error=f"Tool {call['name']} is not available")
+    tool_request = ToolCallRequest(tool_name=call["name"], parameters=call.get("arguments") or {}, server_id=server["id"])
+    return await _execute_tool_call(tool_request, server, db)
+
+@router.post("/chat/agent")
+async def chat_agent(request: AgentChatRequest, db: Database = Depends(get_db)):
+    """
+    Run the generate -> call tools -> generate loop server-side, streaming
+    each step as server-sent events (tool_calls, tool_result, message, done).
+    """
+    llm_service = await _resolve_llm_service(request, db)
+    available_tools, tool_servers = ([], {}) if request.exclude_tools else await _get_available_tools(db)
+    chat_messages = _build_chat_messages(request)
+    
+    async def _events():
+        try:
+            for round_number in range(request.max_tool_rounds + 1):
+                # Withhold tools on the last round so the LLM has to answer
+                tools = available_tools if available_tools and round_number < request.max_tool_rounds else None
+                response = await llm_service.generate_response(chat_messages, tools)
+                content = response.get("content") or ""
+                tool_calls = response.get("tool_calls") or []
+                
+                if not tool_calls:
+                    yield _sse_event("message", {"response": content})
+                    break
+                
+                yield _sse_event("tool_calls", {"content": content, "tool_calls": tool_calls})
+                chat_messages.append(ChatMessage(role="assistant", content=content, tool_calls=tool_calls))
+                
+                # Independent tool calls from one LLM turn run concurrently
+                results = await asyncio.gather(*[
+                    _run_agent_tool_call(call, tool_servers, db) for call in tool_calls
+                ])
+                for call, result in zip(tool_calls, results):
+                    yield _sse_event("tool_result", {"tool_call_id": call["id"], "name": call["name"], **result.model_dump()})
+                    tool_content = result.result if result.success else {"error": result.error}
+                    chat_messages.append(ChatMessage(
+                        role="tool",
+                        content=orjson.dumps(tool_content, default=str).decode(),
+                        tool_call_id=call["id"]
+                    ))
+            yield _sse_event("done", {})
+        except Exception as e:
+            yield _sse_event("error", {"detail": str(e)})
+    
+    return StreamingResponse(_events(), media_type="text/event-stream")
+
+# Tool calling
+# Error messages that suggest the parameters can be corrected and retried
+_VALIDATION_RE = re.compile(r"invalid|required|expected", re.IGNORECASE)
+
+async def _make_tool_call(request: ToolCallRequest, server: Dict[str, Any], db: Database, params: Dict[str, Any]) -> Tuple[bool, Any]:
+    """Make a single tool call against the request's server"""
+    if server["server_type"] == "local":
+        async with _mcp_semaphore():
             result = await mcp_client.call_local_tool(
                 request.server_id,
                 request.tool_name, 
                 params
             )
-        else:
-            # Get server details with API key for remote servers
-            server_with_key = db.get_mcp_server_with_key(request.server_id)
-            if not server_with_key:
-                raise HTTPException(status_code=404, detail="Server details not found")
-            
-            # Decode API key if available
-            api_key = None
-            if server_with_key.get("api_key_hash"):
-                api_key = db.decode_api_key(server_with_key["api_key_hash"])
-            
-            # Call remote tool
+    else:
+        # Get server details with API key for remote servers
+        server_with_key = await db.aget_mcp_server_with_key(request.server_id)
+        if not server_with_key:
+            raise HTTPException(status_code=404, detail="Server details not found")
+        
+        # Decode API key if available
+        api_key = None
+        if server_with_key.get("api_key_hash"):
+            api_key = db.decode_api_key(server_with_key["api_key_hash"])
+        
+        # Call remote tool
+        async with _mcp_semaphore():
             result = await mcp_client.call_tool(
                 server_with_key["url"], 
                 request.tool_name, 
                 params,
                 api_key
             )
-        
-        # Check if result contains a JSON-RPC error
-        if result and isinstance(result, dict) and "error" in result:
-            return False, result["error"]
-        elif result and isinstance(result, dict) and "result" in result:
-            return True, result["result"]
-        else:
-            return False, "Invalid response format from MCP server"
     
+    # Check if result contains a JSON-RPC error
+    if result and isinstance(result, dict) and "error" in result:
+        return False, result["error"]
+    elif result and isinstance(result, dict) and "result" in result:
+        return True, result["result"]
+    else:
+        return False, "Invalid response format from MCP server"
+
+async def _execute_tool_call(request: ToolCallRequest, server: Optional[Dict[str, Any]], db: Database) -> ToolCallResponse:
+    """Run a tool call, retrying once with corrected parameters on validation errors"""
     try:
-        # Get server details
-        servers = db.get_mcp_servers()
-        server = next((s for s in servers if s["id"] == request.server_id), None)
         if not server:
             raise HTTPException(status_code=404, detail="Server not found")
         
-        print(f"[DEBUG] Calling tool {request.tool_name} on {server['server_type']} server {request.server_id}")
-        print(f"[DEBUG] Original parameters: {request.parameters}")
+        logger.debug("Calling tool %s on %s server %s with parameters: %s",
+                     request.tool_name, server['server_type'], request.server_id, request.parameters)
         
         # First attempt with original parameters
-        success, result_or_error = await _make_tool_call(request.parameters)
+        success, result_or_error = await _make_tool_call(request, server, db, request.parameters)
         
         if success:
-            print(f"[DEBUG] Tool call succeeded on first attempt")
-            print(f"[DEBUG] Tool result content: {str(result_or_error)[:200]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Tool call succeeded on first attempt: %s...", str(result_or_error)[:200])
             return ToolCallResponse(success=True, result=result_or_error)
         
         # First attempt failed - check if it's a parameter validation error we can correct
         error_message = result_or_error.get("message", str(result_or_error)) if isinstance(result_or_error, dict) else str(result_or_error)
-        print(f"[DEBUG] Tool call failed: {error_message}")
+        logger.debug("Tool call failed: %s", error_message)
         
         # Try to correct parameters if it's a validation error
-        if "invalid" in error_message.lower() or "required" in error_message.lower() or "expected" in error_message.lower():
-            print(f"[DEBUG] Attempting parameter correction for validation error...")
+        if _VALIDATION_RE.search(error_message):
+            logger.debug("Attempting parameter correction for validation error...")
             
             correction = mcp_parameter_corrector.analyze_error_and_correct(error_message, request.parameters, request.tool_name)
             
             if correction:
-                print(f"[DEBUG] Parameter correction found: {correction.transformation_applied}")
-                print(f"[DEBUG] Corrected parameters: {correction.corrected_params}")
+                logger.debug("Parameter correction found: %s, corrected parameters: %s",
+                             correction.transformation_applied, correction.corrected_params)
                 
                 # Retry with corrected parameters
-                retry_success, retry_result_or_error = await _make_tool_call(correction.corrected_params)
+                retry_success, retry_result_or_error = await _make_tool_call(request, server, db, correction.corrected_params)
                 
                 if retry_success:
-                    print(f"[DEBUG] Tool call succeeded after parameter correction!")
-                    print(f"[DEBUG] Tool result content: {str(retry_result_or_error)[:200]}...")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Tool call succeeded after parameter correction: %s...", str(retry_result_or_error)[:200])
                     return ToolCallResponse(success=True, result=retry_result_or_error)
                 else:
-                    print(f"[DEBUG] Tool call still failed after parameter correction: {retry_result_or_error}")
+                    logger.debug("Tool call still failed after parameter correction: %s", retry_result_or_error)
                     # Return the original error since correction didn't help
                     return ToolCallResponse(success=False, result=None, error=error_message)
             else:
-                print(f"[DEBUG] No parameter correction available for this error")
+                logger.debug("No parameter correction available for this error")
         
         # Return the original error
         return ToolCallResponse(success=False, result=None, error=error_message)
         
     except Exception as e:
-        print(f"[DEBUG] Tool call exception: {str(e)}")
-        return ToolCallResponse(success=False, result=None, error=str(e))
\ No newline at end of file
+        logger.debug("Tool call exception: %s", e)
+        return ToolCallResponse(success=False, result=None, error=str(e))
+
+@router.post("/mcp/call-tool", response_model=ToolCallResponse)
+async def call_tool(request: ToolCallRequest, db: Database = Depends(get_db)):
+    server = await db.aget_mcp_server(request.server_id)
+    return await _execute_tool_call(request, server, db)
+
+@router.post("/mcp/call-tools", response_model=BatchToolCallResponse)
+async def call_tools(batch: BatchToolCallRequest, db: Database = Depends(get_db)):
+    """
+    Execute several tool calls concurrently, returning results in request order.
+    Calls listed in depends_on wait for (and require) their dependencies; the rest run at once.
+    """
+    # Load every involved server with a single query before dispatching
+    servers = await db.aget_mcp_servers_by_ids({c.server_id for c in batch.calls})
+    semaphore = asyncio.Semaphore(max(1, batch.max_concurrent))
+    stop_event = asyncio.Event()
+    tasks: List[asyncio.Task] = []
+    
+    async def _guarded(index: int, call: ToolCallRequest) -> ToolCallResponse:
+        # Wait for dependencies outside the semaphore so they can't be starved of slots
+        for dep in batch.depends_on.get(index, ()):
+            try:
+                dep_result = await tasks[dep]
+            except Exception:
+                dep_result = None
+            if not (dep_result and dep_result.success):
+                return ToolCallResponse(success=False, result=None, error=f"Skipped: dependency call {dep} failed")
+        async with semaphore:
+            if stop_event.is_set():
+                return ToolCallResponse(success=False, result=None, error="Skipped: an earlier tool call in the batch failed")
+            result = await _execute_tool_call(call, servers.get(call.server_id), db)
+            if not result.success and batch.stop_on_error:
+                stop_event.set()
+            return result
+    
+    # Dependencies always point at earlier calls, so their tasks exist by the time they're awaited
+    for index, call in enumerate(batch.calls):
+        tasks.append(asyncio.create_task(_guarded(index, call)))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return BatchToolCallResponse(results=[
+        r if isinstance(r, ToolCallResponse) else ToolCallResponse(success=False, result=None, error=str(r))
+        for r in results
+    ])
\ No newline at end of file
@@ -1,21 +1,175 @@
+import asyncio
 import sqlite3
-import hashlib
 import base64
-from typing import List, Dict, Optional
+import itertools
+import logging
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+import orjson
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 from pathlib import Path
 
+# Upper bound on how stale a cached listing can be (e.g. after edits by another process)
+READ_CACHE_TTL_SECONDS = 10.0
+
+logger = logging.getLogger(__name__)
+
+# Stored in PRAGMA user_version; bump whenever init_database's tables, columns or indexes change
+SCHEMA_VERSION = 1
+
+# Columns added after the first release, as (name, definition) per table
+COLUMN_MIGRATIONS = {
+    "llm_configs": [
+        ("max_tokens", "INTEGER DEFAULT 16000"),
+        ("model", "TEXT DEFAULT 'gpt-3.5-turbo'"),
+    ],
+    "mcp_servers": [
+        ("server_type", "TEXT DEFAULT 'remote'"),
+        ("command", "TEXT"),
+        ("args", "TEXT"),
+        ("auto_start", "BOOLEAN DEFAULT TRUE"),
+        ("process_status", "TEXT DEFAULT 'stopped'"),
+        ("working_directory", "TEXT"),
+    ],
+    "mcp_tools": [
+        ("schema_z", "BLOB"),
+    ],
+}
+
+# NORMAL is crash-safe under WAL and drops the per-commit WAL fsync
+CONNECTION_PRAGMAS = """
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -20000;
+    PRAGMA mmap_size = 268435456;
+"""
+
+@lru_cache(maxsize=256)
+def parse_server_args(args_json: Optional[str]) -> Tuple[str, ...]:
+    """Parse a server's stored args column; memoized since rows repeat across starts"""
+    if not args_json:
+        return ()
+    try:
+        args = orjson.loads(args_json)
+    except orjson.JSONDecodeError:
+        return ()
+    return tuple(args) if isinstance(args, list) else ()
+
+@lru_cache(maxsize=256)
+def _decode_b64(encoded: str) -> str:
+    """Decoded keys are looked up on every remote tool call; the stored strings rarely change"""
+    return base64.b64decode(encoded.encode()).decode()
+
 class Database:
     def __init__(self, db_path: str = "chat_client.db"):
         self.db_path = db_path
+        # One long-lived connection per thread, reused across requests
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # Writes go through one shared connection, serialized in-process, so
+        # concurrent writers queue on the lock instead of hitting SQLITE_BUSY
+        self._write_conn: Optional[sqlite3.Connection] = None
+        self._write_lock = threading.Lock()
+        # Bumped on every write that can change the chat tool list
+        self._tools_versions = itertools.count(1)
+        self._tools_version = 0
+        self._chat_tools_cache: Optional[tuple] = None
+        # Short-lived cache for rarely changing listings, cleared by the matching writes
+        # Entries are stamped with their key's generation at load time; invalidation bumps it, so a
+        # load that raced a write is never served
+        self._read_cache: Dict[str, Tuple[float, int, Any]] = {}
+        self._read_generations: Dict[str, int] = {}
+        self._cache_generations = itertools.count(1)
+        # Decoded configs by id, read on every chat request; cleared by any LLM config write
+        # Stamped with _llm_key_generation like the read cache, so a load racing a write is never served
+        self._llm_key_cache: Dict[int, Tuple[int, Dict]] = {}
+        self._llm_key_generation = 0
+        self._legacy_key_warned: set = set()
         self.init_database()
     
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def _connect(self, **kwargs) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256, **kwargs)
+        # Rows map column names natively, so no per-row name list is rebuilt
+        conn.row_factory = sqlite3.Row
+        # Per-connection settings; journal_mode=WAL is persistent and set in init_database
+        conn.executescript(CONNECTION_PRAGMAS)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+    
+    def get_connection(self) -> sqlite3.Connection:
+        """Return this thread's pooled connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+    
+    @contextmanager
+    def _write_transaction(self) -> Iterator[sqlite3.Cursor]:
+        """Run a group of writes on the shared writer connection as one explicit transaction"""
+        with self._write_lock:
+            if self._write_conn is None:
+                # Autocommit mode: transactions are only the ones begun here
+                self._write_conn = self._connect(isolation_level=None)
+            conn = self._write_conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn.cursor()
+                conn.execute("COMMIT")
+            except BaseException:
+                # A failed COMMIT may already have ended the transaction; never leave the
+                # shared writer inside one, or every later BEGIN fails
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+    
+    def close(self):
+        """Close every pooled connection (called on application shutdown)"""
+        with self._write_lock, self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+            self._write_conn = None
+        self._local = threading.local()
+    
+    def _invalidate_tools(self):
+        self._tools_version = next(self._tools_versions)
+    
+    def _cached(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return a cached value for key, reloading it once it is older than the TTL"""
+        now = time.monotonic()
+        generation = self._read_generations.get(key, 0)
+        entry = self._read_cache.get(key)
+        if entry and entry[0] > now and entry[1] == generation:
+            return entry[2]
+        value = loader()
+        self._read_cache[key] = (now + READ_CACHE_TTL_SECONDS, generation, value)
+        return value
+    
+    def _invalidate(self, key: str):
+        self._read_generations[key] = next(self._cache_generations)
+        self._read_cache.pop(key, None)
+    
+    def _invalidate_llm_configs(self):
+        self._invalidate("llm_configs")
+        self._invalidate("active_llm_config")
+        self._llm_key_generation = next(self._cache_generations)
+        self._llm_key_cache.clear()
     
     def init_database(self):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
+        conn = self.get_connection()
+        # WAL lets readers proceed alongside the writer
+        conn.execute("PRAGMA journal_mode = WAL")
+        # Already at the current schema: nothing to create or migrate
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+        
+        # Create and migrate in a single transaction
+        with self._write_transaction() as cursor:
             # LLM configurations table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS llm_configs (
@@ -30,50 +184,6 @@ class Database:
                 )
             """)
             
-            # Add model column to existing tables if it doesn't exist
-            try:
-                cursor.execute("ALTER TABLE llm_configs ADD COLUMN max_tokens INTEGER DEFAULT 16000")
-            except sqlite3.OperationalError:
-                # Column already exists
-                pass
-            
-            try:
-                cursor.execute("ALTER TABLE llm_configs ADD COLUMN model TEXT DEFAULT 'gpt-3.5-turbo'")
-            except sqlite3.OperationalError:
-                # Column already exists
-                pass
-            
-            # Add local MCP server columns if they don't exist
-            try:
-                cursor.execute("ALTER TABLE mcp_servers ADD COLUMN server_type TEXT DEFAULT 'remote'")
-            except sqlite3.OperationalError:
-                pass
-            
-            try:
-                cursor.execute("ALTER TABLE mcp_servers ADD COLUMN command TEXT")
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                cursor.execute("ALTER TABLE mcp_servers ADD COLUMN args TEXT") 
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                cursor.execute("ALTER TABLE mcp_servers ADD COLUMN auto_start BOOLEAN DEFAULT TRUE")
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                cursor.execute("ALTER TABLE mcp_servers ADD COLUMN process_status TEXT DEFAULT 'stopped'")
-            except sqlite3.OperationalError:
-                pass
-                
-            try:
-                cursor.execute("ALTER TABLE mcp_servers ADD COLUMN working_directory TEXT")
-            except sqlite3.OperationalError:
-                pass
-                
             # Make URL nullable for local servers - Migration disabled temporarily
             # TODO: Re-enable migration after fixing hanging issue
             pass
@@ -110,15 +220,24 @@ class Database:
                     description TEXT,
                     is_enabled BOOLEAN DEFAULT TRUE,
                     schema TEXT,
+                    schema_z BLOB,
                     FOREIGN KEY (server_id) REFERENCES mcp_servers (id) ON DELETE CASCADE,
                     UNIQUE(server_id, name)
                 )
             """)
             
-            conn.commit()
-    
-    def hash_api_key(self, api_key: str) -> str:
-        return hashlib.sha256(api_key.encode()).hexdigest()
+            # Add columns missing from databases created by older versions
+            for table, columns in COLUMN_MIGRATIONS.items():
+                existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+                for column, ddl in columns:
+                    if column not in existing:
+                        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+            
+            # At most one config is active, so this partial index holds a single row.
+            # mcp_tools lookups by server_id already use the UNIQUE(server_id, name) index.
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_configs_active ON llm_configs(is_active) WHERE is_active = 1")
+            
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     
     def encode_api_key(self, api_key: str) -> str:
         """Simple base64 encoding for demo purposes - NOT secure for production"""
@@ -126,57 +245,99 @@ class Database:
     
     def decode_api_key(self, encoded_key: str) -> str:
         """Decode base64 encoded API key"""
-        return base64.b64decode(encoded_key.encode()).decode()
+        return _decode_b64(encoded_key)
     
     # LLM Configuration methods
     def add_llm_config(self, name: str, url: str, api_key: str, provider: str, model: str, max_tokens: int = 16000) -> int:
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        with self._write_transaction() as cursor:
             api_key_encoded = self.encode_api_key(api_key)
             cursor.execute("""
                 INSERT INTO llm_configs (name, url, api_key_hash, provider, model, max_tokens)
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (name, url, api_key_encoded, provider, model, max_tokens))
-            return cursor.lastrowid
+            config_id = cursor.lastrowid
+        self._invalidate_llm_configs()
+        return config_id
     
     def get_llm_configs(self) -> List[Dict]:
+        """List LLM configs (cached; callers must not mutate the result)"""
+        return self._cached("llm_configs", self._load_llm_configs)
+    
+    def _load_llm_configs(self) -> List[Dict]:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT id, name, url, provider, model, is_active, max_tokens FROM llm_configs")
-            return [dict(zip([col[0] for col in cursor.description], row)) for row in cursor.fetchall()]
+            return [dict(row) for row in cursor.fetchall()]
     
-    def set_active_llm(self, config_id: int):
+    def get_llm_config(self, config_id: int) -> Optional[Dict]:
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("UPDATE llm_configs SET is_active = FALSE")
-            cursor.execute("UPDATE llm_configs SET is_active = TRUE WHERE id = ?", (config_id,))
+            cursor.execute("SELECT id, name, url, provider, model, is_active, max_tokens FROM llm_configs WHERE id = ?", (config_id,))
+            row = cursor.fetchone()
+            if row:
+                return dict(row)
+            return None
     
-    def delete_llm_config(self, config_id: int):
+    def get_active_llm_config(self) -> Optional[Dict]:
+        """Get the active LLM config (cached; callers must not mutate the result)"""
+        return self._cached("active_llm_config", self._load_active_llm_config)
+    
+    def _load_active_llm_config(self) -> Optional[Dict]:
         with self.get_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute("SELECT id, name, url, provider, model, is_active, max_tokens FROM llm_configs WHERE is_active = 1 LIMIT 1")
+            row = cursor.fetchone()
+            if row:
+                return dict(row)
+            return None
+    
+    def set_active_llm(self, config_id: int):
+        with self._write_transaction() as cursor:
+            # Only the previously active row and the new one are rewritten
+            cursor.execute(
+                "UPDATE llm_configs SET is_active = (id = ?) WHERE is_active = 1 OR id = ?",
+                (config_id, config_id)
+            )
+        self._invalidate_llm_configs()
+    
+    def delete_llm_config(self, config_id: int):
+        with self._write_transaction() as cursor:
             cursor.execute("DELETE FROM llm_configs WHERE id = ?", (config_id,))
+        self._invalidate_llm_configs()
     
     def update_llm_max_tokens(self, config_id: int, max_tokens: int):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        with self._write_transaction() as cursor:
             cursor.execute("UPDATE llm_configs SET max_tokens = ? WHERE id = ?", (max_tokens, config_id))
+        self._invalidate_llm_configs()
     
     def get_llm_config_with_key(self, config_id: int) -> Optional[Dict]:
-        """Get LLM config including decoded API key for service initialization"""
+        """Get LLM config including decoded API key (cached; callers must not mutate the result)"""
+        generation = self._llm_key_generation
+        entry = self._llm_key_cache.get(config_id)
+        if entry and entry[0] == generation:
+            return entry[1]
+        config = self._load_llm_config_with_key(config_id)
+        if config is not None:
+            self._llm_key_cache[config_id] = (generation, config)
+        return config
+    
+    def _load_llm_config_with_key(self, config_id: int) -> Optional[Dict]:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT id, name, url, api_key_hash, provider, model, is_active, max_tokens FROM llm_configs WHERE id = ?", (config_id,))
             row = cursor.fetchone()
             if row:
-                config = dict(zip([col[0] for col in cursor.description], row))
+                config = dict(row)
                 # Try to decode API key, handle legacy hashed keys
                 if config['api_key_hash']:
                     try:
                         # Try base64 decoding first (new format)
                         config['api_key'] = self.decode_api_key(config['api_key_hash'])
-                    except:
+                    except ValueError:
                         # If that fails, it's likely a legacy hashed key - return a placeholder
-                        print(f"Warning: Legacy hashed API key detected for config {config_id}. Please re-add the API key.")
+                        if config_id not in self._legacy_key_warned:
+                            self._legacy_key_warned.add(config_id)
+                            logger.warning("Legacy hashed API key detected for config %s. Please re-add the API key.", config_id)
                         config['api_key'] = None
                 return config
             return None
@@ -184,18 +345,25 @@ class Database:
     # MCP Server methods
     def add_mcp_server(self, name: str, server_type: str = 'remote', url: Optional[str] = None, 
                       api_key: Optional[str] = None, command: Optional[str] = None, 
-                      args: Optional[str] = None, auto_start: bool = True, 
+                      args: Optional[List[str]] = None, auto_start: bool = True, 
                       working_directory: Optional[str] = None) -> int:
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        # Stored as JSON text; the server row exposes it as-is
+        args_json = orjson.dumps(args).decode() if args is not None else None
+        with self._write_transaction() as cursor:
             api_key_encoded = self.encode_api_key(api_key) if api_key else None
             cursor.execute("""
                 INSERT INTO mcp_servers (name, server_type, url, api_key_hash, command, args, auto_start, working_directory)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (name, server_type, url, api_key_encoded, command, args, auto_start, working_directory))
-            return cursor.lastrowid
+            """, (name, server_type, url, api_key_encoded, command, args_json, auto_start, working_directory))
+            server_id = cursor.lastrowid
+        self._invalidate("mcp_servers")
+        return server_id
     
     def get_mcp_servers(self) -> List[Dict]:
+        """List MCP servers (cached; callers must not mutate the result)"""
+        return self._cached("mcp_servers", self._load_mcp_servers)
+    
+    def _load_mcp_servers(self) -> List[Dict]:
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -203,7 +371,38 @@ class Database:
                        process_status, working_directory, is_enabled, status 
                 FROM mcp_servers
             """)
-            return [dict(zip([col[0] for col in cursor.description], row)) for row in cursor.fetchall()]
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_mcp_server(self, server_id: int) -> Optional[Dict]:
+        """Get a single server by primary key"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, name, server_type, url, command, args, auto_start, 
+                       process_status, working_directory, is_enabled, status 
+                FROM mcp_servers
+                WHERE id = ?
+            """, (server_id,))
+            row = cursor.fetchone()
+            if row:
+                return dict(row)
+            return None
+    
+    def get_mcp_servers_by_ids(self, server_ids: Iterable[int]) -> Dict[int, Dict]:
+        """Get several servers in one query, keyed by id"""
+        server_ids = list(server_ids)
+        if not server_ids:
+            return {}
+        placeholders = ",".join("?" * len(server_ids))
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT id, name, server_type, url, command, args, auto_start, 
+                       process_status, working_directory, is_enabled, status 
+                FROM mcp_servers
+                WHERE id IN ({placeholders})
+            """, server_ids)
+            return {row["id"]: dict(row) for row in cursor.fetchall()}
     
     def get_mcp_server_with_key(self, server_id: int) -> Optional[Dict]:
         """Get server details including API key hash for authentication"""
@@ -212,44 +411,64 @@ class Database:
             cursor.execute("SELECT id, name, url, api_key_hash, is_enabled, status FROM mcp_servers WHERE id = ?", (server_id,))
             row = cursor.fetchone()
             if row:
-                return dict(zip([col[0] for col in cursor.description], row))
+                return dict(row)
             return None
     
+    def _update_servers(self, columns: Tuple[str, ...], rows: Iterable[tuple]):
+        """Set the given mcp_servers columns for many servers in one transaction; rows are (*values, id)"""
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        with self._write_transaction() as cursor:
+            cursor.executemany(f"UPDATE mcp_servers SET {assignments} WHERE id = ?", rows)
+        self._invalidate("mcp_servers")
+        self._invalidate_tools()
+    
     def update_server_status(self, server_id: int, status: str):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE mcp_servers SET status = ? WHERE id = ?", (status, server_id))
+        self._update_servers(("status",), [(status, server_id)])
     
     def update_process_status(self, server_id: int, process_status: str):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("UPDATE mcp_servers SET process_status = ? WHERE id = ?", (process_status, server_id))
+        self._update_servers(("process_status",), [(process_status, server_id)])
+    
+    def update_server_states(self, server_id: int, process_status: str, status: str):
+        """Update process and connection status together in a single write"""
+        self._update_servers(("process_status", "status"), [(process_status, status, server_id)])
+    
+    def update_many_server_states(self, states: Iterable[Tuple[int, str, str]]):
+        """Update (server_id, process_status, status) for several servers in a single write"""
+        rows = [(process_status, status, server_id) for server_id, process_status, status in states]
+        if rows:
+            self._update_servers(("process_status", "status"), rows)
     
     def toggle_server_enabled(self, server_id: int, enabled: bool):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        with self._write_transaction() as cursor:
             cursor.execute("UPDATE mcp_servers SET is_enabled = ? WHERE id = ?", (enabled, server_id))
             # When disabling a server, disable all its tools as well
             if not enabled:
                 cursor.execute("UPDATE mcp_tools SET is_enabled = ? WHERE server_id = ?", (False, server_id))
+        self._invalidate("mcp_servers")
+        self._invalidate_tools()
     
     def delete_mcp_server(self, server_id: int):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        with self._write_transaction() as cursor:
             cursor.execute("DELETE FROM mcp_servers WHERE id = ?", (server_id,))
+        self._invalidate("mcp_servers")
+        self._invalidate_tools()
     
     # MCP Tools methods
     def add_mcp_tools(self, server_id: int, tools: List[Dict]):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            import json
-            for tool in tools:
-                # Properly serialize schema as JSON
-                schema_json = json.dumps(tool.get('inputSchema', tool.get('schema', {})))
-                cursor.execute("""
-                    INSERT OR REPLACE INTO mcp_tools (server_id, name, description, schema)
-                    VALUES (?, ?, ?, ?)
-                """, (server_id, tool['name'], tool.get('description', ''), schema_json))
+        rows = []
+        for tool in tools:
+            # Normalize once here so chat requests can use the schema as-is
+            schema = tool.get('inputSchema', tool.get('schema', {}))
+            if not schema or not isinstance(schema, dict):
+                schema = {"type": "object", "properties": {}}
+            rows.append((server_id, tool['name'], tool.get('description', ''), zlib.compress(orjson.dumps(schema))))
+        # One write transaction (and one sync) for the whole tool list
+        with self._write_transaction() as cursor:
+            cursor.executemany("""
+                INSERT OR REPLACE INTO mcp_tools (server_id, name, description, schema_z)
+                VALUES (?, ?, ?, ?)
+            """, rows)
+        self._invalidate_tools()
     
     def get_server_tools(self, server_id: int) -> List[Dict]:
         with self.get_connection() as conn:
@@ -259,9 +478,88 @@ class Database:
                 FROM mcp_tools 
                 WHERE server_id = ?
             """, (server_id,))
-            return [dict(zip([col[0] for col in cursor.description], row)) for row in cursor.fetchall()]
+            return [dict(row) for row in cursor.fetchall()]
     
-    def toggle_tool_enabled(self, tool_id: int, enabled: bool):
+    def get_active_tools_for_chat(self) -> List[Dict]:
+        """
+        Get enabled tools on enabled, connected servers in one query, with parsed schemas.
+        The result is cached until the tool list changes; callers must not mutate it.
+        """
+        version = self._tools_version
+        cached = self._chat_tools_cache
+        if cached and cached[0] == version:
+            return cached[1]
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("UPDATE mcp_tools SET is_enabled = ? WHERE id = ?", (enabled, tool_id))
\ No newline at end of file
+            cursor.execute("""
+                SELECT t.name, t.description, t.schema, t.schema_z, s.id AS server_id, s.server_type
+                FROM mcp_tools t
+                JOIN mcp_servers s ON s.id = t.server_id
+                WHERE t.is_enabled AND s.is_enabled AND s.status = 'connected'
+                ORDER BY t.id
+            """)
+            tools = [dict(row) for row in cursor.fetchall()]
+        for tool in tools:
+            # Parse stored schema (compressed, or plain text from older versions) or use default
+            schema_z = tool.pop("schema_z")
+            try:
+                schema = orjson.loads(zlib.decompress(schema_z) if schema_z else tool["schema"] or "{}")
+            except (ValueError, zlib.error):
+                schema = None
+            if not schema or not isinstance(schema, dict):
+                schema = {"type": "object", "properties": {}}
+            tool["schema"] = schema
+        self._chat_tools_cache = (version, tools)
+        return tools
+    
+    def toggle_tool_enabled(self, tool_id: int, enabled: bool):
+        with self._write_transaction() as cursor:
+            cursor.execute("UPDATE mcp_tools SET is_enabled = ? WHERE id = ?", (enabled, tool_id))
+        self._invalidate_tools()
+    
+    # Async variants for request handlers: run the blocking call in a worker
+    # thread so SQLite IO doesn't stall the event loop
+    async def _run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    
+    async def aget_llm_config(self, config_id: int) -> Optional[Dict]:
+        return await self._run(self.get_llm_config, config_id)
+    
+    async def aget_active_llm_config(self) -> Optional[Dict]:
+        return await self._run(self.get_active_llm_config)
+    
+    async def aget_llm_config_with_key(self, config_id: int) -> Optional[Dict]:
+        return await self._run(self.get_llm_config_with_key, config_id)
+    
+    async def aadd_mcp_server(self, name: str, **kwargs) -> int:
+        return await self._run(self.add_mcp_server, name, **kwargs)
+    
+    async def aget_mcp_servers(self) -> List[Dict]:
+        return await self._run(self.get_mcp_servers)
+    
+    async def aget_mcp_server(self, server_id: int) -> Optional[Dict]:
+        return await self._run(self.get_mcp_server, server_id)
+    
+    async def aget_mcp_servers_by_ids(self, server_ids: Iterable[int]) -> Dict[int, Dict]:
+        return await self._run(self.get_mcp_servers_by_ids, server_ids)
+    
+    async def aget_mcp_server_with_key(self, server_id: int) -> Optional[Dict]:
+        return await self._run(self.get_mcp_server_with_key, server_id)
+    
+    async def adelete_mcp_server(self, server_id: int):
+        await self._run(self.delete_mcp_server, server_id)
+    
+    async def aupdate_server_status(self, server_id: int, status: str):
+        await self._run(self.update_server_status, server_id, status)
+    
+    async def aupdate_server_states(self, server_id: int, process_status: str, status: str):
+        await self._run(self.update_server_states, server_id, process_status, status)
+    
+    async def aupdate_many_server_states(self, states: Iterable[Tuple[int, str, str]]):
+        await self._run(self.update_many_server_states, states)
+    
+    async def aadd_mcp_tools(self, server_id: int, tools: List[Dict]):
+        await self._run(self.add_mcp_tools, server_id, tools)
+    
+    async def aget_active_tools_for_chat(self) -> List[Dict]:
+        return await self._run(self.get_active_tools_for_chat)
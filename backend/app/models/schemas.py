@@ -1,4 +1,4 @@
-from pydantic import BaseModel, HttpUrl, model_validator
+from pydantic import BaseModel, Field, HttpUrl, model_validator
 from typing import Optional, List, Dict, Any
 from enum import Enum
 
@@ -86,6 +86,9 @@ class ChatRequest(BaseModel):
     llm_config_id: Optional[int] = None
     exclude_tools: Optional[bool] = False  # Set to True for final responses after tool execution
 
+class AgentChatRequest(ChatRequest):
+    max_tool_rounds: int = Field(5, ge=0, le=20)  # LLM turns allowed to call tools before a final answer is forced
+
 class ChatResponse(BaseModel):
     response: str
     tool_calls: Optional[List[Dict[str, Any]]] = None
@@ -98,4 +101,20 @@ class ToolCallRequest(BaseModel):
 class ToolCallResponse(BaseModel):
     success: bool
     result: Optional[Any] = None
-    error: Optional[str] = None
\ No newline at end of file
+    error: Optional[str] = None
+
+class BatchToolCallRequest(BaseModel):
+    calls: List[ToolCallRequest]
+    max_concurrent: int = 8
+    stop_on_error: bool = False  # Skip calls that haven't started once one fails
+    depends_on: Dict[int, List[int]] = {}  # Call index -> indices of earlier calls that must succeed first
+    
+    @model_validator(mode='after')
+    def validate_depends_on(self):
+        for index, dependencies in self.depends_on.items():
+            if not 0 <= index < len(self.calls) or any(not 0 <= dep < index for dep in dependencies):
+                raise ValueError('depends_on may only reference earlier calls in the batch')
+        return self
+
+class BatchToolCallResponse(BaseModel):
+    results: List[ToolCallResponse]
\ No newline at end of file
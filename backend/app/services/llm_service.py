@@ -1,113 +1,241 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import httpx
 import openai
 import google.generativeai as genai
 import boto3
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from ..models.schemas import ChatMessage, LLMProvider
-import json
+import orjson
+
+logger = logging.getLogger(__name__)
+
+_gemini_api_key: Optional[str] = None
+_client_cache: Dict[tuple, Any] = {}
+
+# Cap on in-flight requests per provider across all services, so bursts queue
+# here instead of tripping provider rate limits
+LLM_MAX_CONCURRENCY = {
+    LLMProvider.OPENAI: int(os.environ.get("LLM_MAX_CONCURRENCY_OPENAI", "50")),
+    LLMProvider.GEMINI: int(os.environ.get("LLM_MAX_CONCURRENCY_GEMINI", "20")),
+    LLMProvider.BEDROCK: int(os.environ.get("LLM_MAX_CONCURRENCY_BEDROCK", "20")),
+}
+_provider_semaphores: Dict[LLMProvider, asyncio.Semaphore] = {}
+
+def _provider_semaphore(provider: LLMProvider) -> asyncio.Semaphore:
+    """Shared per-provider limit, created on first use so it binds to the server's event loop (Python 3.9)"""
+    semaphore = _provider_semaphores.get(provider)
+    if semaphore is None:
+        semaphore = _provider_semaphores[provider] = asyncio.Semaphore(LLM_MAX_CONCURRENCY[provider])
+    return semaphore
+
+# One connection pool shared by every OpenAI-compatible client, whatever the key or endpoint;
+# created on first use (clients are built in worker threads) and dropped again on shutdown
+_shared_http_client: Optional[httpx.AsyncClient] = None
+_shared_http_client_lock = threading.Lock()
+
+def _get_shared_http_client() -> httpx.AsyncClient:
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is None:
+            _shared_http_client = openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=256, max_keepalive_connections=64)
+            )
+        return _shared_http_client
+
+async def close_http_client():
+    """Close the shared LLM connection pool and forget the SDK clients using it (called on application shutdown)"""
+    global _shared_http_client
+    with _shared_http_client_lock:
+        http_client, _shared_http_client = _shared_http_client, None
+    # Cached clients point at the closed pool (and hold API keys); a restart builds new ones
+    _client_cache.clear()
+    if http_client is not None:
+        await http_client.aclose()
+
+def _configure_gemini(api_key: str):
+    """genai keeps its API key globally; reconfigure only when switching keys"""
+    global _gemini_api_key
+    if _gemini_api_key != api_key:
+        genai.configure(api_key=api_key)
+        _gemini_api_key = api_key
+
+def _normalize_message(msg: Any) -> Tuple[str, Any, Optional[List[Dict]], Optional[str]]:
+    """Read (role, content, tool_calls, tool_call_id) from a ChatMessage or dict"""
+    if isinstance(msg, tuple):
+        # Already normalized
+        return msg
+    if isinstance(msg, dict):
+        return msg.get("role"), msg.get("content"), msg.get("tool_calls"), msg.get("tool_call_id")
+    if hasattr(msg, 'role'):
+        return msg.role, msg.content, getattr(msg, 'tool_calls', None), getattr(msg, 'tool_call_id', None)
+    logger.warning("Unexpected message type: %s, content: %s", type(msg), msg)
+    return "user", str(msg), None, None
+
+def _openai_tool_call(tc: Dict[str, Any]) -> Dict[str, Any]:
+    if "function" in tc:
+        # Frontend format: {id, type, function: {name, arguments}}
+        name = tc["function"].get("name")
+        arguments = tc["function"].get("arguments", "{}")
+    else:
+        # Backend format: {id, name, arguments}
+        name = tc.get("name")
+        arguments = orjson.dumps(tc.get("arguments", {})).decode()
+    return {"id": tc.get("id"), "type": "function", "function": {"name": name, "arguments": arguments}}
+
+def _openai_tool_message(role, content, tool_calls, tool_call_id) -> Dict[str, Any]:
+    return {"role": "tool", "content": content, "tool_call_id": tool_call_id}
+
+def _openai_assistant_message(role, content, tool_calls, tool_call_id) -> Dict[str, Any]:
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = [_openai_tool_call(tc) for tc in tool_calls if isinstance(tc, dict)]
+    return message
+
+def _openai_plain_message(role, content, tool_calls, tool_call_id) -> Dict[str, Any]:
+    return {"role": role, "content": content}
+
+def _prompt_text(messages: List[ChatMessage]) -> str:
+    """Flatten a conversation to "role: content" lines for text-only providers"""
+    return "\n".join(f"{role}: {content}" for role, content, _, _ in map(_normalize_message, messages))
+
+def _assemble_tool_calls(partial_calls: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Join streamed tool call argument fragments, in the order the calls were started"""
+    tool_calls = []
+    for index in sorted(partial_calls):
+        call = partial_calls[index]
+        arguments = "".join(call["arguments"])
+        tool_calls.append({
+            "id": call["id"],
+            "name": call["name"],
+            "arguments": orjson.loads(arguments) if arguments else {}
+        })
+    return tool_calls
+
+def _bedrock_tool_use(tc: Dict[str, Any]) -> Dict[str, Any]:
+    if "function" in tc:
+        # Frontend format: {id, type, function: {name, arguments}}
+        name = tc["function"].get("name")
+        arguments = orjson.loads(tc["function"].get("arguments") or "{}")
+    else:
+        # Backend format: {id, name, arguments}
+        name = tc.get("name")
+        arguments = tc.get("arguments", {})
+    return {"toolUse": {"toolUseId": tc.get("id"), "name": name, "input": arguments}}
+
+# Converts a normalized message to OpenAI format by role; other roles are sent as plain messages
+_OPENAI_MESSAGE_BUILDERS = {
+    "tool": _openai_tool_message,
+    "assistant": _openai_assistant_message,
+}
 
 class LLMService:
-    def __init__(self, provider: LLMProvider, api_key: str, model: str, base_url: Optional[str] = None, max_tokens: int = 16000):
+    def __init__(self, provider: LLMProvider, api_key: str, model: str, base_url: Optional[str] = None, max_tokens: int = 16000,
+                 max_concurrency: Optional[int] = None):
         self.provider = provider
         self.api_key = api_key
         self.model = model
         self.base_url = base_url
         self.max_tokens = max_tokens
+        # Shared per-provider limit unless this service is given its own
+        # (services are built off the loop, so the semaphore itself is created on first use)
+        self.max_concurrency = max_concurrency
+        self._own_semaphore: Optional[asyncio.Semaphore] = None
         
-        if provider == LLMProvider.OPENAI:
+        if provider == LLMProvider.GEMINI:
+            _configure_gemini(api_key)
+        # Share SDK clients (and their connection pools) between services with the
+        # same credentials; only Gemini binds the model into the client
+        client_key = (
+            provider,
+            hashlib.blake2b(api_key.encode(), digest_size=16).digest(),
+            model if provider == LLMProvider.GEMINI else None,
+            base_url
+        )
+        self.client = _client_cache.get(client_key)
+        if self.client is None:
+            self.client = _client_cache.setdefault(client_key, self._build_client())
+    
+    def _build_client(self) -> Any:
+        if self.provider == LLMProvider.OPENAI:
             # Remove trailing /chat/completions from base_url if present
-            clean_base_url = base_url
-            if base_url and base_url.endswith('/chat/completions'):
-                clean_base_url = base_url.rsplit('/chat/completions', 1)[0]
+            clean_base_url = self.base_url
+            if self.base_url and self.base_url.endswith('/chat/completions'):
+                clean_base_url = self.base_url.rsplit('/chat/completions', 1)[0]
             
-            self.client = openai.OpenAI(
-                api_key=api_key,
-                base_url=clean_base_url if clean_base_url else None
+            return openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=clean_base_url if clean_base_url else None,
+                http_client=_get_shared_http_client()
             )
-        elif provider == LLMProvider.GEMINI:
-            genai.configure(api_key=api_key)
-            self.client = genai.GenerativeModel(model or 'gemini-pro')
-        elif provider == LLMProvider.BEDROCK:
-            self.client = boto3.client(
+        elif self.provider == LLMProvider.GEMINI:
+            return genai.GenerativeModel(self.model or 'gemini-pro')
+        elif self.provider == LLMProvider.BEDROCK:
+            api_key = self.api_key
+            return boto3.client(
                 'bedrock-runtime',
                 aws_access_key_id=api_key.split(':')[0] if ':' in api_key else api_key,
                 aws_secret_access_key=api_key.split(':')[1] if ':' in api_key else '',
-                region_name=base_url or 'us-east-1'
+                region_name=self.base_url or 'us-east-1'
             )
     
     async def generate_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
         """Generate a response from the LLM"""
+        # Normalize once; the request builders accept normalized messages as-is
+        messages = [_normalize_message(msg) for msg in messages]
+        try:
+            async with self._semaphore():
+                if self.provider == LLMProvider.OPENAI:
+                    result = await self._generate_openai_response(messages, tools)
+                elif self.provider == LLMProvider.GEMINI:
+                    result = await self._generate_gemini_response(messages, tools)
+                elif self.provider == LLMProvider.BEDROCK:
+                    result = await self._generate_bedrock_response(messages, tools)
+                else:
+                    return None
+        except Exception as e:
+            raise Exception(f"LLM generation failed: {str(e)}")
+        return result
+    
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Concurrency slot for this service's requests; must be called from the event loop"""
+        if not self.max_concurrency:
+            return _provider_semaphore(self.provider)
+        if self._own_semaphore is None:
+            self._own_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._own_semaphore
+    
+    async def generate_response_stream(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream a response from the LLM as events:
+        {"type": "token", "content"}, {"type": "tool_call", "id", "name"} when a
+        tool call is first seen, and a final {"type": "done", "content", "tool_calls"}.
+        """
         try:
             if self.provider == LLMProvider.OPENAI:
-                return await self._generate_openai_response(messages, tools)
+                stream = self._stream_openai_response(messages, tools)
             elif self.provider == LLMProvider.GEMINI:
-                return await self._generate_gemini_response(messages, tools)
+                stream = self._stream_gemini_response(messages, tools)
             elif self.provider == LLMProvider.BEDROCK:
-                return await self._generate_bedrock_response(messages, tools)
+                stream = self._stream_bedrock_response(messages, tools)
+            else:
+                return
+            # The slot is held until the stream is fully consumed
+            async with self._semaphore():
+                async for event in stream:
+                    yield event
         except Exception as e:
             raise Exception(f"LLM generation failed: {str(e)}")
     
-    async def _generate_openai_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
-        """Generate response using OpenAI-compatible API"""
-        openai_messages = []
-        for msg in messages:
-            # Handle both Pydantic models and dicts
-            if hasattr(msg, 'role'):
-                role = msg.role
-                content = msg.content
-                tool_calls = getattr(msg, 'tool_calls', None)
-                tool_call_id = getattr(msg, 'tool_call_id', None)
-            elif isinstance(msg, dict):
-                role = msg.get("role")
-                content = msg.get("content")
-                tool_calls = msg.get("tool_calls")
-                tool_call_id = msg.get("tool_call_id")
-            else:
-                print(f"Unexpected message type: {type(msg)}, content: {msg}")
-                openai_messages.append({"role": "user", "content": str(msg)})
-                continue
-                
-            # Handle different message roles
-            if role == "tool":
-                # Tool response message
-                openai_messages.append({
-                    "role": "tool",
-                    "content": content,
-                    "tool_call_id": tool_call_id
-                })
-            elif role == "assistant" and tool_calls:
-                # Assistant message with tool calls
-                message = {"role": "assistant", "content": content}
-                if tool_calls:
-                    # Convert tool calls to OpenAI format
-                    formatted_tool_calls = []
-                    for tc in tool_calls:
-                        if isinstance(tc, dict):
-                            # Handle both direct format and nested function format
-                            if "function" in tc:
-                                # Frontend format: {id, type, function: {name, arguments}}
-                                formatted_tool_calls.append({
-                                    "id": tc.get("id"),
-                                    "type": "function",
-                                    "function": {
-                                        "name": tc["function"].get("name"),
-                                        "arguments": tc["function"].get("arguments", "{}")
-                                    }
-                                })
-                            else:
-                                # Backend format: {id, name, arguments}
-                                formatted_tool_calls.append({
-                                    "id": tc.get("id"),
-                                    "type": "function",
-                                    "function": {
-                                        "name": tc.get("name"),
-                                        "arguments": json.dumps(tc.get("arguments", {}))
-                                    }
-                                })
-                    message["tool_calls"] = formatted_tool_calls
-                openai_messages.append(message)
-            else:
-                # Regular user/assistant message
-                openai_messages.append({"role": role, "content": content})
+    def _build_openai_request(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Convert messages and tools to OpenAI chat completion kwargs"""
+        openai_messages = [
+            _OPENAI_MESSAGE_BUILDERS.get(role, _openai_plain_message)(role, content, tool_calls, tool_call_id)
+            for role, content, tool_calls, tool_call_id in map(_normalize_message, messages)
+        ]
         
         kwargs = {
             "model": self.model,  # Use configured model
@@ -120,7 +248,12 @@ class LLMService:
             kwargs["tools"] = tools
             kwargs["tool_choice"] = "auto"
         
-        response = self.client.chat.completions.create(**kwargs)
+        return kwargs
+    
+    async def _generate_openai_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Generate response using OpenAI-compatible API"""
+        kwargs = self._build_openai_request(messages, tools)
+        response = await self.client.chat.completions.create(**kwargs)
         
         result = {
             "content": response.choices[0].message.content,
@@ -132,47 +265,156 @@ class LLMService:
                 {
                     "id": call.id,
                     "name": call.function.name,
-                    "arguments": json.loads(call.function.arguments)
+                    "arguments": orjson.loads(call.function.arguments)
                 }
                 for call in response.choices[0].message.tool_calls
             ]
         
         return result
     
+    async def _stream_openai_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream response using OpenAI-compatible API, assembling tool call deltas"""
+        kwargs = self._build_openai_request(messages, tools)
+        kwargs["stream"] = True
+        stream = await self.client.chat.completions.create(**kwargs)
+        
+        content_parts = []
+        partial_calls: Dict[int, Dict[str, Any]] = {}
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield {"type": "token", "content": delta.content}
+            for tc in delta.tool_calls or []:
+                call = partial_calls.setdefault(tc.index, {"id": None, "name": None, "arguments": []})
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function and tc.function.name:
+                    call["name"] = tc.function.name
+                    yield {"type": "tool_call", "id": call["id"], "name": call["name"]}
+                if tc.function and tc.function.arguments:
+                    call["arguments"].append(tc.function.arguments)
+        
+        yield {"type": "done", "content": "".join(content_parts), "tool_calls": _assemble_tool_calls(partial_calls)}
+    
     async def _generate_gemini_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
         """Generate response using Gemini"""
+        # Services are reused across requests, so make sure the global key is ours
+        _configure_gemini(self.api_key)
+        
         # Convert messages to Gemini format
-        prompt = "\n".join([f"{msg.role}: {msg.content}" for msg in messages])
+        prompt = _prompt_text(messages)
         
-        response = self.client.generate_content(prompt)
+        response = await self.client.generate_content_async(prompt)
         
         return {
             "content": response.text,
             "tool_calls": []  # Basic implementation, can be enhanced for tool calling
         }
     
-    async def _generate_bedrock_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
-        """Generate response using AWS Bedrock"""
-        # Convert messages to Claude format for Bedrock
-        prompt = "\n".join([f"{msg.role}: {msg.content}" for msg in messages])
-        
-        body = json.dumps({
-            "prompt": f"\n\nHuman: {prompt}\n\nAssistant:",
-            "max_tokens_to_sample": self.max_tokens,
-            "temperature": 0.7,
-            "stop_sequences": ["\n\nHuman:"]
-        })
+    async def _stream_gemini_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream response using Gemini"""
+        _configure_gemini(self.api_key)
         
-        response = self.client.invoke_model(
-            body=body,
-            modelId="anthropic.claude-v2",
-            accept="application/json",
-            contentType="application/json"
-        )
+        content_parts = []
+        async for chunk in await self.client.generate_content_async(_prompt_text(messages), stream=True):
+            if chunk.text:
+                content_parts.append(chunk.text)
+                yield {"type": "token", "content": chunk.text}
         
-        response_body = json.loads(response.get('body').read())
+        yield {"type": "done", "content": "".join(content_parts), "tool_calls": []}
+    
+    def _build_bedrock_request(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Convert messages and OpenAI-format tools to Bedrock Converse kwargs"""
+        system = []
+        converse_messages = []
+        for role, content, tool_calls, tool_call_id in map(_normalize_message, messages):
+            if role == "system":
+                if content:
+                    system.append({"text": content})
+                continue
+            if role == "tool":
+                # Tool results go back to the model as a user turn
+                role = "user"
+                blocks = [{"toolResult": {"toolUseId": tool_call_id, "content": [{"text": content or ""}]}}]
+            else:
+                blocks = [{"text": content}] if content else []
+                if role == "assistant":
+                    blocks.extend(_bedrock_tool_use(tc) for tc in tool_calls or [] if isinstance(tc, dict))
+                else:
+                    role = "user"
+            if not blocks:
+                continue
+            # Converse requires alternating roles, so merge consecutive turns (e.g. several tool results)
+            if converse_messages and converse_messages[-1]["role"] == role:
+                converse_messages[-1]["content"].extend(blocks)
+            else:
+                converse_messages.append({"role": role, "content": blocks})
+        
+        kwargs = {
+            "modelId": self.model or "anthropic.claude-v2",
+            "messages": converse_messages,
+            "inferenceConfig": {"maxTokens": self.max_tokens, "temperature": 0.7}
+        }
+        if system:
+            kwargs["system"] = system
+        if tools:
+            kwargs["toolConfig"] = {"tools": [
+                {
+                    "toolSpec": {
+                        "name": tool["function"]["name"],
+                        "description": tool["function"].get("description") or tool["function"]["name"],
+                        "inputSchema": {"json": tool["function"].get("parameters") or {"type": "object", "properties": {}}}
+                    }
+                }
+                for tool in tools
+            ]}
+        return kwargs
+    
+    async def _generate_bedrock_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Generate response using the AWS Bedrock Converse API"""
+        kwargs = self._build_bedrock_request(messages, tools)
+        # boto3 is blocking, so run it in a worker thread
+        response = await asyncio.to_thread(self.client.converse, **kwargs)
         
+        blocks = response["output"]["message"]["content"]
         return {
-            "content": response_body.get('completion', ''),
-            "tool_calls": []  # Basic implementation
-        }
\ No newline at end of file
+            "content": "".join(block["text"] for block in blocks if "text" in block),
+            "tool_calls": [
+                {
+                    "id": block["toolUse"]["toolUseId"],
+                    "name": block["toolUse"]["name"],
+                    "arguments": block["toolUse"]["input"]
+                }
+                for block in blocks if "toolUse" in block
+            ]
+        }
+    
+    async def _stream_bedrock_response(self, messages: List[ChatMessage], tools: Optional[List[Dict]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream response using the AWS Bedrock ConverseStream API, assembling tool use deltas"""
+        kwargs = self._build_bedrock_request(messages, tools)
+        response = await asyncio.to_thread(self.client.converse_stream, **kwargs)
+        # The event stream is a blocking iterator; pull each event in a worker thread
+        events = iter(response["stream"])
+        
+        content_parts = []
+        partial_calls: Dict[int, Dict[str, Any]] = {}
+        while (event := await asyncio.to_thread(next, events, None)) is not None:
+            if "contentBlockStart" in event:
+                tool_use = event["contentBlockStart"]["start"].get("toolUse")
+                if tool_use:
+                    partial_calls[event["contentBlockStart"]["contentBlockIndex"]] = {
+                        "id": tool_use["toolUseId"], "name": tool_use["name"], "arguments": []
+                    }
+                    yield {"type": "tool_call", "id": tool_use["toolUseId"], "name": tool_use["name"]}
+            elif "contentBlockDelta" in event:
+                delta = event["contentBlockDelta"]["delta"]
+                if delta.get("text"):
+                    content_parts.append(delta["text"])
+                    yield {"type": "token", "content": delta["text"]}
+                elif "toolUse" in delta:
+                    partial_calls[event["contentBlockDelta"]["contentBlockIndex"]]["arguments"].append(delta["toolUse"]["input"])
+        
+        yield {"type": "done", "content": "".join(content_parts), "tool_calls": _assemble_tool_calls(partial_calls)}
@@ -1,9 +1,9 @@
-import subprocess
-import json
+import orjson
 import asyncio
 import logging
 import os
 import shutil
+from functools import lru_cache
 from typing import Dict, Optional, List, Any
 from pathlib import Path
 import uuid
@@ -11,25 +11,31 @@ import time
 
 logger = logging.getLogger(__name__)
 
+# Max size of one JSON-RPC line on stdout; tool results can be much larger than asyncio's 64KB default
+STDOUT_LINE_LIMIT = 16 * 1024 * 1024
+
+@lru_cache(maxsize=256)
+def _which_cached(command: str, path: str) -> Optional[str]:
+    """Resolve a command against PATH, or accept it as an executable file path."""
+    return shutil.which(command, path=path) or (command if os.path.isfile(command) and os.access(command, os.X_OK) else None)
+
 class LocalMCPManager:
     def __init__(self):
-        self.processes: Dict[int, subprocess.Popen] = {}
+        self.processes: Dict[int, asyncio.subprocess.Process] = {}
         self.server_configs: Dict[int, Dict] = {}
+        # Responses are matched to in-flight requests by JSON-RPC id, so requests can be pipelined
+        self.pending_requests: Dict[int, Dict[Any, asyncio.Future]] = {}
+        self.reader_tasks: Dict[int, asyncio.Task] = {}
+        # Static part of each server's health report, built once at start
+        self.health_templates: Dict[int, Dict[str, Any]] = {}
         self.logs_dir = Path("logs")
         self.logs_dir.mkdir(exist_ok=True)
     
     def validate_command(self, command: str) -> bool:
         """Validate that a command exists and is executable."""
         try:
-            # Check if command exists in PATH
-            if shutil.which(command):
-                return True
-            
-            # Check if it's an absolute path and executable
-            if os.path.isfile(command) and os.access(command, os.X_OK):
-                return True
-                
-            return False
+            # Keyed on PATH too, so changes to the environment are picked up
+            return bool(_which_cached(command, os.environ.get("PATH", "")))
         except Exception as e:
             logger.error(f"Error validating command {command}: {e}")
             return False
@@ -38,50 +44,48 @@ class LocalMCPManager:
         """Verify and cleanup MCP server processes on startup."""
         try:
             # Get all servers from database
-            servers = db.get_mcp_servers()
+            servers = await db.aget_mcp_servers()
             local_servers = [s for s in servers if s.get("server_type") == "local"]
             
-            print(f"[DEBUG] Found {len(local_servers)} local MCP servers in database")
+            logger.debug("Found %d local MCP servers in database", len(local_servers))
             
+            stale_servers = []
             for server in local_servers:
                 server_id = server["id"]
                 server_name = server["name"]
                 
                 # Check if server is marked as running in database
                 if server.get("status") == "connected" or server.get("process_status") == "running":
-                    print(f"[DEBUG] Checking server {server_id} ({server_name}) marked as running")
+                    logger.debug("Checking server %s (%s) marked as running", server_id, server_name)
                     
                     # Verify if process is actually running
                     health = self.check_server_health(server_id)
                     if not health.get("running", False):
-                        print(f"[DEBUG] Server {server_id} ({server_name}) not actually running, updating status")
-                        # Update database to reflect actual status
-                        db.update_process_status(server_id, "stopped")
-                        db.update_server_status(server_id, "stopped")
+                        logger.debug("Server %s (%s) not actually running, updating status", server_id, server_name)
+                        stale_servers.append((server_id, "stopped", "stopped"))
+            
+            # Update database to reflect actual status in one write
+            await db.aupdate_many_server_states(stale_servers)
             
-            print(f"[DEBUG] Startup cleanup completed for {len(local_servers)} servers")
+            logger.debug("Startup cleanup completed for %d servers", len(local_servers))
             
         except Exception as e:
             logger.error(f"Error during startup cleanup: {e}")
-            print(f"[DEBUG] Error during startup cleanup: {e}")
     
     async def start_server(self, server_id: int, name: str, command: str, args: List[str], working_directory: Optional[str] = None) -> bool:
         """Start a local MCP server process."""
-        print(f"[DEBUG] LocalMCPManager.start_server called - ID: {server_id}, name: {name}")
+        logger.debug("Starting MCP server %s (ID: %s)", name, server_id)
         try:
             # Validate command first
-            print(f"[DEBUG] Validating command in LocalMCPManager: {command}")
             if not self.validate_command(command):
                 logger.error(f"Command not found or not executable: {command}")
-                print(f"[DEBUG] Command validation failed in LocalMCPManager")
                 return False
-            print(f"[DEBUG] Command validation passed in LocalMCPManager")
             
             # Parse args if it's a JSON string
             if isinstance(args, str):
                 try:
-                    args = json.loads(args)
-                except json.JSONDecodeError:
+                    args = orjson.loads(args)
+                except orjson.JSONDecodeError:
                     args = []
             
             if not isinstance(args, list):
@@ -89,30 +93,28 @@ class LocalMCPManager:
             
             # Prepare command array
             cmd_array = [command] + args
-            print(f"[DEBUG] Command array: {cmd_array}")
-            print(f"[DEBUG] Working directory: {working_directory}")
+            logger.debug("Command array: %s, working directory: %s", cmd_array, working_directory)
             
             # Set up log files
             log_file = self.logs_dir / f"mcp-{name}-{server_id}.log"
             error_log_file = self.logs_dir / f"mcp-{name}-{server_id}-error.log"
-            print(f"[DEBUG] Log file: {log_file}")
-            print(f"[DEBUG] Error log file: {error_log_file}")
+            logger.debug("Log file: %s, error log file: %s", log_file, error_log_file)
             
             # Start the process with improved logging
-            print(f"[DEBUG] Starting subprocess...")
             with open(log_file, 'w') as log_f, open(error_log_file, 'w') as err_f:
-                process = subprocess.Popen(
-                    cmd_array,
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
+                process = await asyncio.create_subprocess_exec(
+                    *cmd_array,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
                     stderr=err_f,
-                    text=True,
-                    bufsize=0,
-                    cwd=working_directory if working_directory else None
+                    cwd=working_directory if working_directory else None,
+                    limit=STDOUT_LINE_LIMIT
                 )
-            print(f"[DEBUG] Subprocess started with PID: {process.pid}")
+            logger.debug("Subprocess started with PID: %s", process.pid)
             
             self.processes[server_id] = process
+            self.pending_requests[server_id] = {}
+            self.reader_tasks[server_id] = asyncio.create_task(self._reader_loop(server_id, process))
             self.server_configs[server_id] = {
                 'name': name,
                 'command': command,
@@ -120,48 +122,32 @@ class LocalMCPManager:
                 'working_directory': working_directory,
                 'log_file': str(log_file)
             }
+            self.health_templates[server_id] = {
+                'pid': process.pid,
+                'name': name,
+                'command': command,
+                'log_file': str(log_file)
+            }
             
-            # Give process a moment to start with timeout
-            print(f"[DEBUG] Waiting up to 3s for process to stabilize...")
-            stabilization_timeout = 3.0
-            check_interval = 0.1
-            elapsed = 0
-            
-            while elapsed < stabilization_timeout:
-                await asyncio.sleep(check_interval)
-                elapsed += check_interval
-                
-                # Check if process crashed early
-                if process.poll() is not None:
-                    logger.error(f"MCP server {name} (ID: {server_id}) crashed during startup")
-                    print(f"[DEBUG] Process crashed during startup, exit code: {process.returncode}")
-                    self.cleanup_server(server_id)
-                    return False
-                
-                # Process is still running after some time, consider it stable
-                if elapsed >= 1.0:  # Wait at least 1 second for stability
-                    break
-            
-            # Final check if process is still running
-            print(f"[DEBUG] Final check - process running: {process.poll() is None}")
-            if process.poll() is None:
+            # Consider the process stable if it is still running after 1 second
+            try:
+                returncode = await asyncio.wait_for(process.wait(), 1.0)
+            except asyncio.TimeoutError:
                 logger.info(f"Successfully started MCP server {name} (ID: {server_id})")
-                print(f"[DEBUG] Process is running successfully")
                 return True
-            else:
-                logger.error(f"MCP server {name} (ID: {server_id}) failed to start")
-                print(f"[DEBUG] Process failed to start, exit code: {process.returncode}")
-                self.cleanup_server(server_id)
-                return False
+            
+            logger.error(f"MCP server {name} (ID: {server_id}) crashed during startup")
+            logger.debug("Exit code: %s", returncode)
+            self.cleanup_server(server_id)
+            return False
                 
         except Exception as e:
             error_msg = f"Error starting MCP server {name}: {str(e)}"
             logger.error(error_msg)
-            print(error_msg)  # Also print to console for debugging
             self.cleanup_server(server_id)
             return False
     
-    def stop_server(self, server_id: int) -> bool:
+    async def stop_server(self, server_id: int) -> bool:
         """Stop a local MCP server process."""
         try:
             if server_id not in self.processes:
@@ -171,22 +157,22 @@ class LocalMCPManager:
             process = self.processes[server_id]
             server_name = self.server_configs.get(server_id, {}).get('name', f'ID-{server_id}')
             
-            if process.poll() is None:  # Process is running
+            if process.returncode is None:  # Process is running
                 logger.info(f"Stopping MCP server {server_name} (ID: {server_id})")
                 process.terminate()
                 
                 # Wait for graceful shutdown with timeout
                 try:
-                    process.wait(timeout=10)  # Increased timeout
+                    await asyncio.wait_for(process.wait(), 10.0)  # Increased timeout
                     logger.info(f"MCP server {server_name} terminated gracefully")
-                except subprocess.TimeoutExpired:
+                except asyncio.TimeoutError:
                     logger.warning(f"MCP server {server_name} did not terminate gracefully, force killing")
                     # Force kill if it doesn't shut down gracefully
                     process.kill()
                     try:
-                        process.wait(timeout=5)  # Wait for kill to complete
+                        await asyncio.wait_for(process.wait(), 5.0)  # Wait for kill to complete
                         logger.info(f"MCP server {server_name} force killed")
-                    except subprocess.TimeoutExpired:
+                    except asyncio.TimeoutError:
                         logger.error(f"Failed to force kill MCP server {server_name}")
                         return False
             else:
@@ -206,6 +192,12 @@ class LocalMCPManager:
             del self.processes[server_id]
         if server_id in self.server_configs:
             del self.server_configs[server_id]
+        reader_task = self.reader_tasks.pop(server_id, None)
+        if reader_task:
+            reader_task.cancel()
+        self._fail_pending(server_id)
+        self.pending_requests.pop(server_id, None)
+        self.health_templates.pop(server_id, None)
     
     def is_server_running(self, server_id: int) -> bool:
         """Check if a server process is running."""
@@ -213,7 +205,7 @@ class LocalMCPManager:
             return False
         
         process = self.processes[server_id]
-        return process.poll() is None
+        return process.returncode is None
     
     def get_server_status(self, server_id: int) -> str:
         """Get the current status of a server."""
@@ -225,58 +217,88 @@ class LocalMCPManager:
         else:
             return 'error'
     
-    async def send_request(self, server_id: int, request: Dict[str, Any], timeout: float = 10.0) -> Optional[Dict[str, Any]]:
-        """Send a JSON-RPC request to a local MCP server with timeout."""
+    def _fail_pending(self, server_id: int):
+        """Wake every caller still waiting on this server with no response."""
+        pending = self.pending_requests.get(server_id, {})
+        for future in pending.values():
+            if not future.done():
+                future.set_result(None)
+        pending.clear()
+    
+    async def _reader_loop(self, server_id: int, process: asyncio.subprocess.Process):
+        """Read JSON-RPC messages from a server's stdout and resolve the matching pending request."""
+        server_name = self.server_configs.get(server_id, {}).get('name', f'ID-{server_id}')
         try:
-            if not self.is_server_running(server_id):
-                logger.warning(f"Cannot send request to server {server_id}: not running")
-                return None
-            
-            process = self.processes[server_id]
-            server_name = self.server_configs.get(server_id, {}).get('name', f'ID-{server_id}')
-            
-            # Send request with timeout handling
-            request_json = json.dumps(request) + '\n'
-            logger.debug(f"Sending request to {server_name}: {request.get('method', 'unknown')}")
-            
-            try:
-                # Send request
-                process.stdin.write(request_json)
-                process.stdin.flush()
-                
-                # Read response with timeout using select
-                import select
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    logger.warning(f"Output from {server_name} closed")
+                    break
+                if not line.strip():
+                    continue
                 
-                # Use select to wait for data with timeout
-                ready, _, _ = select.select([process.stdout], [], [], timeout)
+                try:
+                    message = orjson.loads(line)
+                except orjson.JSONDecodeError as e:
+                    logger.error(f"Invalid JSON response from server {server_name}: {e}")
+                    continue
                 
-                if ready:
-                    response_line = process.stdout.readline()
-                    
-                    if response_line.strip():
-                        response = json.loads(response_line.strip())
-                        logger.debug(f"Received response from {server_name}")
-                        return response
-                    else:
-                        logger.warning(f"Empty response from {server_name}")
-                        return None
-                else:
-                    logger.error(f"Request to {server_name} timed out after {timeout}s")
-                    return None
-                    
-            except Exception as inner_e:
-                logger.error(f"Communication error with {server_name}: {inner_e}")
+                future = self.pending_requests.get(server_id, {}).pop(message.get("id"), None) if isinstance(message, dict) else None
+                if future is None:
+                    # Server-initiated notifications and responses to requests we gave up on
+                    logger.debug("Ignoring unmatched message from %s", server_name)
+                elif not future.done():
+                    logger.debug("Received response from %s", server_name)
+                    future.set_result(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error reading from server {server_name}: {e}")
+        finally:
+            self._fail_pending(server_id)
+    
+    async def send_request(self, server_id: int, request: Dict[str, Any], timeout: float = 10.0) -> Optional[Dict[str, Any]]:
+        """Send a JSON-RPC request to a local MCP server with timeout.
+        
+        Requests without an id are notifications: they are written and None is returned
+        without waiting for a reply.
+        """
+        server_name = self.server_configs.get(server_id, {}).get('name', f'ID-{server_id}')
+        if not self.is_server_running(server_id):
+            logger.warning(f"Cannot send request to server {server_id}: not running")
+            return None
+        
+        process = self.processes[server_id]
+        pending = self.pending_requests[server_id]
+        request_id = request.get("id")
+        future = None
+        if request_id is not None:
+            if request_id in pending:
+                request = {**request, "id": uuid.uuid4().hex}
+                request_id = request["id"]
+            future = asyncio.get_running_loop().create_future()
+            pending[request_id] = future
+        
+        logger.debug("Sending request to %s: %s", server_name, request.get('method', 'unknown'))
+        try:
+            process.stdin.write(orjson.dumps(request, default=str, option=orjson.OPT_APPEND_NEWLINE))
+            await process.stdin.drain()
+            if future is None:
                 return None
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON response from server {server_id}: {e}")
-            print(f"[DEBUG] JSON decode error: {e}")
+            response = await asyncio.wait_for(future, timeout)
+            if response is None:
+                logger.warning(f"No response from {server_name}")
+            return response
+        except asyncio.TimeoutError:
+            logger.error(f"Request to {server_name} timed out after {timeout}s")
             return None
         except Exception as e:
-            server_name = self.server_configs.get(server_id, {}).get('name', f'ID-{server_id}')
             logger.error(f"Error sending request to server {server_name} ({server_id}): {e}")
-            print(f"[DEBUG] General error: {e}")
             return None
+        finally:
+            if request_id is not None:
+                pending.pop(request_id, None)
     
     def get_running_servers(self) -> List[int]:
         """Get list of currently running server IDs."""
@@ -292,31 +314,15 @@ class LocalMCPManager:
                 'exit_code': None
             }
         
-        process = self.processes[server_id]
-        config = self.server_configs.get(server_id, {})
-        
-        if process.poll() is None:
+        returncode = self.processes[server_id].returncode
+        health = dict(self.health_templates[server_id])
+        if returncode is None:
             # Process is running
-            return {
-                'status': 'running',
-                'running': True,
-                'pid': process.pid,
-                'exit_code': None,
-                'name': config.get('name', f'ID-{server_id}'),
-                'command': config.get('command'),
-                'log_file': config.get('log_file')
-            }
+            health.update(status='running', running=True, exit_code=None)
         else:
             # Process has exited
-            return {
-                'status': 'exited',
-                'running': False,
-                'pid': process.pid,
-                'exit_code': process.returncode,
-                'name': config.get('name', f'ID-{server_id}'),
-                'command': config.get('command'),
-                'log_file': config.get('log_file')
-            }
+            health.update(status='exited', running=False, exit_code=returncode)
+        return health
     
     def get_all_server_health(self) -> Dict[int, Dict[str, Any]]:
         """Get health status for all managed servers."""
@@ -339,11 +345,15 @@ class LocalMCPManager:
         
         return len(dead_servers)
     
-    def shutdown_all(self):
+    async def shutdown_all(self):
         """Shutdown all running servers."""
-        logger.info(f"Shutting down {len(self.processes)} MCP servers")
-        for server_id in list(self.processes.keys()):
-            self.stop_server(server_id)
+        server_ids = list(self.processes.keys())
+        logger.info(f"Shutting down {len(server_ids)} MCP servers")
+        # stop_server handles its own errors, so every server gets its full termination window in parallel
+        results = await asyncio.gather(*[self.stop_server(server_id) for server_id in server_ids])
+        failed = [server_id for server_id, stopped in zip(server_ids, results) if not stopped]
+        if failed:
+            logger.warning(f"Failed to stop MCP servers: {failed}")
 
 # Global instance
 local_mcp_manager = LocalMCPManager()
\ No newline at end of file
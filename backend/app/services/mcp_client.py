@@ -1,31 +1,83 @@
 import httpx
-import json
-from typing import Dict, List, Any, Optional
-import uuid
+import itertools
+from functools import lru_cache
+import logging
+import orjson
+import os
+from typing import Dict, List, Any, Optional, Tuple
 from .local_mcp_manager import local_mcp_manager
 
+logger = logging.getLogger(__name__)
+
+# Cap on in-flight MCP calls per process; the HTTP pool is sized to match
+MCP_MAX_CONCURRENCY = int(os.environ.get("MCP_MAX_CONCURRENCY", "32"))
+
+# Handshakes should fail fast on dead servers; tool calls may legitimately run long
+_PROBE_TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+_CALL_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Constant JSON-RPC payloads; requests only add an id (the nested params are shared, never mutated)
+_INITIALIZE_REQUEST = {
+    "jsonrpc": "2.0",
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2025-06-18",
+        "capabilities": {
+            "tools": {},
+            "logging": {}
+        },
+        "clientInfo": {
+            "name": "simple-mcp-chat-client",
+            "version": "1.0.0"
+        }
+    }
+}
+_TOOLS_LIST_REQUEST = {
+    "jsonrpc": "2.0",
+    "method": "tools/list",
+    "params": {}
+}
+_INITIALIZED_NOTIFICATION = {
+    "jsonrpc": "2.0",
+    "method": "notifications/initialized",
+    "params": {}
+}
+_INITIALIZED_NOTIFICATION_BODY = orjson.dumps(_INITIALIZED_NOTIFICATION)
+
+@lru_cache(maxsize=32)
+def _request_headers(api_key: Optional[str]) -> Tuple[Tuple[str, str], ...]:
+    """Per-request headers on top of the client defaults; only the API key varies"""
+    return (("Authorization", f"ApiKey {api_key}"),) if api_key else ()
+
+def _check_status(response: httpx.Response) -> None:
+    """Raise on HTTP errors with a snippet of the body, which usually explains the failure"""
+    if response.status_code >= 400:
+        raise Exception(f"MCP HTTP {response.status_code}: {response.text[:200]}")
+
 class MCPClient:
     def __init__(self):
-        self.client = httpx.AsyncClient(timeout=30.0)
+        # One pooled client for the app's lifetime (closed from the lifespan shutdown);
+        # HTTP/2 lets concurrent calls to the same MCP server share a connection
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=MCP_MAX_CONCURRENCY * 2,
+                max_keepalive_connections=MCP_MAX_CONCURRENCY,
+                keepalive_expiry=30.0
+            ),
+            http2=True,
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "User-Agent": "simple-mcp-chat-client/1.0"
+            }
+        )
+        # JSON-RPC ids only need to be unique per client, so a counter will do
+        self._request_ids = itertools.count(1)
     
     async def initialize_local_connection(self, server_id: int) -> Dict[str, Any]:
         """Initialize connection with local MCP server using JSON-RPC 2.0"""
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2025-06-18",
-                "capabilities": {
-                    "tools": {},
-                    "logging": {}
-                },
-                "clientInfo": {
-                    "name": "simple-mcp-chat-client",
-                    "version": "1.0.0"
-                }
-            }
-        }
+        init_request = {**_INITIALIZE_REQUEST, "id": next(self._request_ids)}
         
         try:
             result = await local_mcp_manager.send_request(server_id, init_request)
@@ -38,48 +90,23 @@ class MCPClient:
     
     async def _send_local_initialized_notification(self, server_id: int) -> None:
         """Send initialized notification to local server"""
-        notification = {
-            "jsonrpc": "2.0",
-            "method": "notifications/initialized",
-            "params": {}
-        }
-        
         try:
-            await local_mcp_manager.send_request(server_id, notification)
+            await local_mcp_manager.send_request(server_id, _INITIALIZED_NOTIFICATION)
         except Exception as e:
-            print(f"Warning: failed to send initialized notification to local server: {e}")
+            logger.warning("Failed to send initialized notification to local server: %s", e)
 
     async def initialize_connection(self, server_url: str, api_key: Optional[str] = None) -> Dict[str, Any]:
         """Initialize connection with MCP server using JSON-RPC 2.0"""
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "User-Agent": "simple-mcp-chat-client/1.0"
-        }
-        if api_key:
-            headers["Authorization"] = f"ApiKey {api_key}"
+        headers = _request_headers(api_key)
         
-        init_request = {
-            "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
-            "method": "initialize",
-            "params": {
-                "protocolVersion": "2025-06-18",
-                "capabilities": {
-                    "tools": {},
-                    "logging": {}
-                },
-                "clientInfo": {
-                    "name": "simple-mcp-chat-client",
-                    "version": "1.0.0"
-                }
-            }
-        }
+        init_request = {**_INITIALIZE_REQUEST, "id": next(self._request_ids)}
         
         try:
-            response = await self.client.post(server_url, json=init_request, headers=headers)
-            response.raise_for_status()
-            result = response.json()
+            response = await self.client.post(server_url, content=orjson.dumps(init_request, default=str), headers=headers, timeout=_PROBE_TIMEOUT)
+            _check_status(response)
+            # Concurrent tool calls only share a connection when the server negotiates HTTP/2
+            logger.debug("Connected to MCP server %s over %s", server_url, response.http_version)
+            result = orjson.loads(response.content)
             
             # Send initialized notification after successful initialize
             await self._send_initialized_notification(server_url, headers)
@@ -88,30 +115,34 @@ class MCPClient:
         except Exception as e:
             raise Exception(f"Failed to initialize MCP connection: {str(e)}")
     
-    async def _send_initialized_notification(self, server_url: str, headers: Dict[str, str]) -> None:
-        """Send initialized notification after successful initialize"""
-        notification = {
-            "jsonrpc": "2.0",
-            "method": "notifications/initialized",
-            "params": {}
-        }
+    async def initialize_and_list(self, server_url: str, api_key: Optional[str] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Initialize a remote MCP server and list its tools.
         
+        Returns the initialize response and the tools (empty if listing failed). The steps stay
+        sequential: the MCP lifecycle requires the initialize result before notifications/initialized,
+        and protocol 2025-06-18 no longer allows JSON-RPC batches.
+        """
+        init_result = await self.initialize_connection(server_url, api_key)
         try:
-            response = await self.client.post(server_url, json=notification, headers=headers)
+            tools = await self.list_tools(server_url, api_key)
+        except Exception as e:
+            logger.warning("Failed to discover tools: %s", e)
+            tools = []
+        return init_result, tools
+    
+    async def _send_initialized_notification(self, server_url: str, headers: Tuple[Tuple[str, str], ...]) -> None:
+        """Send initialized notification after successful initialize"""
+        try:
+            response = await self.client.post(server_url, content=_INITIALIZED_NOTIFICATION_BODY, headers=headers, timeout=_PROBE_TIMEOUT)
             # Notifications don't expect responses, but log if there's an error
             if response.status_code >= 400:
-                print(f"Warning: initialized notification returned {response.status_code}")
+                logger.warning("Initialized notification returned %s", response.status_code)
         except Exception as e:
-            print(f"Warning: failed to send initialized notification: {e}")
+            logger.warning("Failed to send initialized notification: %s", e)
 
     async def list_local_tools(self, server_id: int) -> List[Dict[str, Any]]:
         """List available tools from local MCP server"""
-        tools_request = {
-            "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
-            "method": "tools/list",
-            "params": {}
-        }
+        tools_request = {**_TOOLS_LIST_REQUEST, "id": next(self._request_ids)}
         
         try:
             result = await local_mcp_manager.send_request(server_id, tools_request)
@@ -125,24 +156,14 @@ class MCPClient:
 
     async def list_tools(self, server_url: str, api_key: Optional[str] = None) -> List[Dict[str, Any]]:
         """List available tools from MCP server"""
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        if api_key:
-            headers["Authorization"] = f"ApiKey {api_key}"
+        headers = _request_headers(api_key)
         
-        tools_request = {
-            "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
-            "method": "tools/list",
-            "params": {}
-        }
+        tools_request = {**_TOOLS_LIST_REQUEST, "id": next(self._request_ids)}
         
         try:
-            response = await self.client.post(server_url, json=tools_request, headers=headers)
-            response.raise_for_status()
-            result = response.json()
+            response = await self.client.post(server_url, content=orjson.dumps(tools_request, default=str), headers=headers)
+            _check_status(response)
+            result = orjson.loads(response.content)
             
             if "result" in result and "tools" in result["result"]:
                 return result["result"]["tools"]
@@ -154,7 +175,7 @@ class MCPClient:
         """Call a specific tool on local MCP server"""
         tool_request = {
             "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
+            "id": next(self._request_ids),
             "method": "tools/call",
             "params": {
                 "name": tool_name,
@@ -170,16 +191,11 @@ class MCPClient:
 
     async def call_tool(self, server_url: str, tool_name: str, parameters: Dict[str, Any], api_key: Optional[str] = None) -> Dict[str, Any]:
         """Call a specific tool on the MCP server"""
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-        if api_key:
-            headers["Authorization"] = f"ApiKey {api_key}"
+        headers = _request_headers(api_key)
         
         tool_request = {
             "jsonrpc": "2.0",
-            "id": str(uuid.uuid4()),
+            "id": next(self._request_ids),
             "method": "tools/call",
             "params": {
                 "name": tool_name,
@@ -188,28 +204,18 @@ class MCPClient:
         }
         
         try:
-            response = await self.client.post(server_url, json=tool_request, headers=headers)
-            response.raise_for_status()
-            return response.json()
+            response = await self.client.post(server_url, content=orjson.dumps(tool_request, default=str), headers=headers, timeout=_CALL_TIMEOUT)
+            _check_status(response)
+            return orjson.loads(response.content)
         except Exception as e:
             raise Exception(f"Failed to call tool {tool_name}: {str(e)}")
     
-    async def test_local_connection(self, server_id: int) -> bool:
-        """Test if we can connect to a local MCP server"""
-        try:
-            if not local_mcp_manager.is_server_running(server_id):
-                return False
-            result = await self.initialize_local_connection(server_id)
-            return "result" in result and "protocolVersion" in result.get("result", {})
-        except:
-            return False
-
     async def test_connection(self, server_url: str, api_key: Optional[str] = None) -> bool:
         """Test if we can connect to an MCP server"""
         try:
             result = await self.initialize_connection(server_url, api_key)
             return "result" in result and "protocolVersion" in result.get("result", {})
-        except:
+        except Exception:
             return False
     
     async def close(self):
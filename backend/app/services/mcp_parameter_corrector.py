@@ -1,11 +1,141 @@
 import re
-import json
-from typing import Dict, Any, Optional, Tuple
-from dataclasses import dataclass
+import logging
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import ClassVar, Dict, Any, FrozenSet, List, Mapping, NamedTuple, Optional, Tuple
+from dataclasses import dataclass, replace
+import orjson
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+# Patterns used on every correction attempt, compiled once; the first finds the
+# parameter path and the array/string wording in a single pass over the error
+# (the path value is only looked ahead at, so wording inside it is still scanned)
+_ERROR_FEATURES_RE = re.compile(r'"path":\s*\[\s*"(?=(?P<path>[^"]+)"\s*\])|(?P<array>(?i:array))|(?P<string>(?i:string|undefined))')
+_QUOTED_RE = re.compile(r'"([^"]+)"')
+_SNAKE_RE = re.compile(r'"([^"]*_[^"]*)"')
+_SEPARATOR_RE = re.compile(r'[_-]')
+
+# Parameter names that can stand in for a missing "symbol", in order of preference
+_SYMBOL_SOURCES = ("ticker", "stock", "asset")
+
+# Every transformation needs at least one of these in the error; others (timeouts, etc.) are skipped
+_CORRECTION_MARKERS = ('"path"', "array", "Required", "indices", "undefined", "Expected", "_")
+
+def _frozen(mappings: Dict[str, Dict[str, Any]]) -> Mapping[str, Mapping[str, Any]]:
+    """Read-only view of a table of per-tool mappings"""
+    return MappingProxyType({key: MappingProxyType(value) for key, value in mappings.items()})
+
+def _invert_mapping(mapping: Mapping[str, str]) -> Mapping[str, FrozenSet[str]]:
+    """Group source parameter names by the parameter they map to"""
+    inverse: Dict[str, List[str]] = {}
+    for source, target in mapping.items():
+        inverse.setdefault(target, []).append(source)
+    return MappingProxyType({target: frozenset(sources) for target, sources in inverse.items()})
+
+# Explicit parameter mappings for known tool parameter differences
+_EXPLICIT_MAPPINGS = _frozen({
+    # Tool-specific mappings
+    "utilities_search_customer-lookup": {
+        "query": "search_term",
+        "name": "search_term",
+        "customer": "search_term",
+        "customer_name": "search_term"
+    },
+    "utilities_research_asset-news": {
+        "ticker": "symbol",
+        "stock": "symbol",
+        "asset": "symbol",
+        "period": "time_period",
+        "timeframe": "time_period"
+    },
+    "customer_success_lookup_trades_by_name": {
+        "customer_name": "account_name",
+        "name": "account_name",
+        "customer": "account_name"
+    }
+})
+
+# Default values for missing required parameters by tool
+_DEFAULT_VALUES = _frozen({
+    "utilities_research_asset-news": {
+        "time_period": "1w",
+        "symbol": "SPY",
+        "limit": 10
+    },
+    "utilities_search_customer-lookup": {
+        "limit": 20,
+        "offset": 0,
+        "search_term": "John Doe"  # fallback if no query provided
+    },
+    "customer_success_lookup_trades_by_name": {
+        "account_name": "John Doe",  # fallback
+        "limit": 10
+    }
+})
+
+# Universal parameter mappings (across all tools)
+_UNIVERSAL_MAPPINGS = MappingProxyType({
+    "query": "search_term",
+    "search": "search_term",
+    "q": "search_term",
+    "ticker": "symbol",
+    "stock": "symbol",
+    "asset": "symbol",
+    "customer": "account_name",
+    "user": "account_name",
+    "period": "time_period",
+    "timeframe": "time_period",
+    "duration": "time_period"
+})
+
+# Inverted views keyed by the required parameter: target -> source names that map to it
+_INVERSE_EXPLICIT_MAPPINGS = MappingProxyType({
+    tool: _invert_mapping(mappings) for tool, mappings in _EXPLICIT_MAPPINGS.items()
+})
+_INVERSE_UNIVERSAL_MAPPINGS = _invert_mapping(_UNIVERSAL_MAPPINGS)
+
+def _normalize_name(name: str) -> str:
+    """Parameter name with separators dropped and case folded, for fuzzy matching"""
+    return _SEPARATOR_RE.sub('', name).lower()
+
+def _rename_key(params: Dict[str, Any], old: str, new: str, value: Any) -> Dict[str, Any]:
+    """New dict with `old` renamed to `new` and set to `value`, built in one pass"""
+    if old not in params or new in params:
+        corrected = {**params, new: value}
+        if old != new:
+            corrected.pop(old, None)
+        return corrected
+    return {(new if key == old else key): (value if key == old else item) for key, item in params.items()}
+
+class _ErrorFeatures(NamedTuple):
+    """What the transforms need to know about an error message, extracted once"""
+    required_param: Optional[str] = None
+    mentions_array: bool = False
+    mentions_string: bool = False
+
+def _scan_error(error_message: str) -> _ErrorFeatures:
+    """Collect the error's parameter path and array/string wording in one scan"""
+    required_param = None
+    mentions_array = mentions_string = False
+    for match in _ERROR_FEATURES_RE.finditer(error_message):
+        if match.group("path") is not None:
+            if required_param is None:
+                required_param = match.group("path")
+        elif match.group("array") is not None:
+            mentions_array = True
+        else:
+            mentions_string = True
+        if required_param is not None and mentions_array and mentions_string:
+            break
+    return _ErrorFeatures(required_param, mentions_array, mentions_string)
+
+@dataclass(frozen=True)
 class ParameterCorrection:
     """Represents a parameter correction that was applied"""
+    # Declared by hand rather than with dataclass(slots=True), which needs Python 3.10
+    __slots__ = ("original_params", "corrected_params", "transformation_applied", "confidence")
+    
     original_params: Dict[str, Any]
     corrected_params: Dict[str, Any]
     transformation_applied: str
@@ -17,96 +147,25 @@ class MCPParameterCorrector:
     to match the expected format. Works with any MCP server by parsing error messages.
     """
     
-    def __init__(self):
-        # Explicit parameter mappings for known tool parameter differences
-        self.explicit_parameter_mappings = {
-            # Tool-specific mappings
-            "utilities_search_customer-lookup": {
-                "query": "search_term",
-                "name": "search_term",
-                "customer": "search_term",
-                "customer_name": "search_term"
-            },
-            "utilities_research_asset-news": {
-                "ticker": "symbol",
-                "stock": "symbol",
-                "asset": "symbol",
-                "period": "time_period",
-                "timeframe": "time_period"
-            },
-            "customer_success_lookup_trades_by_name": {
-                "customer_name": "account_name",
-                "name": "account_name",
-                "customer": "account_name"
-            }
-        }
-
-        # Default values for missing required parameters by tool
-        self.default_parameter_values = {
-            "utilities_research_asset-news": {
-                "time_period": "1w",
-                "symbol": "SPY",
-                "limit": 10
-            },
-            "utilities_search_customer-lookup": {
-                "limit": 20,
-                "offset": 0,
-                "search_term": "John Doe"  # fallback if no query provided
-            },
-            "customer_success_lookup_trades_by_name": {
-                "account_name": "John Doe",  # fallback
-                "limit": 10
-            }
-        }
-
-        # Universal parameter mappings (across all tools)
-        self.universal_parameter_mappings = {
-            "query": "search_term",
-            "search": "search_term",
-            "q": "search_term",
-            "ticker": "symbol",
-            "stock": "symbol",
-            "asset": "symbol",
-            "customer": "account_name",
-            "user": "account_name",
-            "period": "time_period",
-            "timeframe": "time_period",
-            "duration": "time_period"
-        }
-
-        # Common parameter transformation patterns
-        self.transformation_patterns = [
-            # Explicit mappings (highest priority)
-            {
-                "name": "explicit_mapping",
-                "pattern": r'.*',  # matches everything
-                "transform": self._explicit_mapping_transform
-            },
-            # Missing required parameter defaults
-            {
-                "name": "missing_parameter_defaults",
-                "pattern": r'Required.*undefined',
-                "transform": self._missing_parameter_defaults_transform
-            },
-            # String to array transformations
-            {
-                "name": "string_to_array",
-                "pattern": r'Expected.*array.*received.*string|Required.*\["([^"]+)"\].*array',
-                "transform": self._string_to_array_transform
-            },
-            # Singular to plural transformations
-            {
-                "name": "singular_to_plural",
-                "pattern": r'Expected.*"([^"]*s)".*received.*"([^"]*)"(?!s)',
-                "transform": self._singular_to_plural_transform
-            },
-            # Snake case to camel case
-            {
-                "name": "snake_to_camel",
-                "pattern": r'Expected.*"([^"]*_[^"]*)".*received.*"([^"]*)"',
-                "transform": self._snake_to_camel_transform
-            }
-        ]
+    # Common parameter transformations: (name, required substring, transform method name).
+    # A transform is skipped when its required substring is missing from the error.
+    _TRANSFORMS: ClassVar[Tuple[Tuple[str, str, str], ...]] = (
+        # Explicit mappings (highest priority)
+        ("explicit_mapping", '"path"', "_explicit_mapping_transform"),
+        # Missing required parameter defaults
+        ("missing_parameter_defaults", '"path"', "_missing_parameter_defaults_transform"),
+        # String to array transformations
+        ("string_to_array", '"path"', "_string_to_array_transform"),
+        # Singular to plural transformations
+        ("singular_to_plural", '"', "_singular_to_plural_transform"),
+        # Snake case to camel case
+        ("snake_to_camel", '_', "_snake_to_camel_transform")
+    )
+    
+    def __init__(self, cache_size: int = 512):
+        # Agents often repeat the same mistake; remember recent outcomes (including "no correction")
+        self.cache_size = cache_size
+        self._correction_cache: "OrderedDict[bytes, Optional[ParameterCorrection]]" = OrderedDict()
     
     def analyze_error_and_correct(self, error_message: str, original_params: Dict[str, Any], tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
         """
@@ -119,98 +178,127 @@ class MCPParameterCorrector:
         Returns:
             ParameterCorrection if a correction was found, None otherwise
         """
-        print(f"[DEBUG] Analyzing MCP error for parameter correction: {error_message}")
-        print(f"[DEBUG] Original parameters: {original_params}")
+        if not any(marker in error_message for marker in _CORRECTION_MARKERS):
+            return None
+        
+        try:
+            # Parameter order is kept in the key since transforms pick the first matching name
+            cache_key = orjson.dumps([error_message, original_params, tool_name, user_message], default=str)
+        except TypeError:
+            cache_key = None
+        if cache_key is not None and cache_key in self._correction_cache:
+            self._correction_cache.move_to_end(cache_key)
+            correction = self._correction_cache[cache_key]
+            logger.debug("Reusing cached parameter correction result")
+            if correction is None:
+                return None
+            # Hand out fresh dicts so callers never share state with the cache
+            return replace(correction, original_params=original_params, corrected_params=dict(correction.corrected_params))
         
-        # Try each transformation pattern
-        for pattern_info in self.transformation_patterns:
+        correction = self._analyze(error_message, original_params, tool_name, user_message)
+        if cache_key is not None and self.cache_size > 0:
+            self._correction_cache[cache_key] = correction
+            while len(self._correction_cache) > self.cache_size:
+                self._correction_cache.popitem(last=False)
+        return correction
+
+    def _analyze(self, error_message: str, original_params: Dict[str, Any], tool_name: Optional[str], user_message: Optional[str]) -> Optional[ParameterCorrection]:
+        """Run the transforms for an error that has not been seen recently"""
+        logger.debug("Analyzing MCP error for parameter correction: %s", error_message)
+        logger.debug("Original parameters: %s", original_params)
+        
+        # Parameter path and wording checks shared by the transforms, from one scan
+        features = _scan_error(error_message)
+        
+        # Try every transformation and keep the most confident correction; a failed
+        # retry costs far more than running the remaining transforms
+        candidates = []
+        for name, marker, method_name in self._TRANSFORMS:
+            if marker not in error_message:
+                continue
             try:
-                correction = pattern_info["transform"](error_message, original_params, tool_name, user_message)
+                correction = getattr(self, method_name)(error_message, original_params, features, tool_name, user_message)
                 if correction:
-                    print(f"[DEBUG] Applied transformation '{pattern_info['name']}': {correction.transformation_applied}")
-                    return correction
+                    logger.debug("Transformation '%s' proposed: %s", name, correction.transformation_applied)
+                    candidates.append(correction)
             except Exception as e:
-                print(f"[DEBUG] Transformation '{pattern_info['name']}' failed: {e}")
-                continue
+                # The traceback is only formatted if debug logging is enabled
+                logger.debug("Transformation '%s' failed: %s", name, e, exc_info=True)
         
         # Try specific known error patterns
-        correction = self._handle_specific_patterns(error_message, original_params)
+        correction = self._handle_specific_patterns(error_message, original_params, features.required_param)
         if correction:
+            candidates.append(correction)
+        
+        if candidates:
+            # max() keeps the earliest candidate on ties, preserving transform priority
+            correction = max(candidates, key=lambda candidate: candidate.confidence)
+            logger.debug("Applied correction: %s", correction.transformation_applied)
             return correction
             
-        print(f"[DEBUG] No parameter correction found for error: {error_message}")
+        logger.debug("No parameter correction found for error: %s", error_message)
         return None
 
-    def _explicit_mapping_transform(self, error_message: str, params: Dict[str, Any], tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
+    def _explicit_mapping_transform(self, error_message: str, params: Dict[str, Any], features: _ErrorFeatures, tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
         """Apply explicit parameter mappings for known tool parameter differences"""
+        required_param = features.required_param
 
-        # Extract the required parameter name from the error message
-        path_match = re.search(r'"path":\s*\[\s*"([^"]+)"\s*\]', error_message)
-        if not path_match:
+        if required_param is None:
             return None
 
-        required_param = path_match.group(1)
-
         # Check tool-specific mappings first
-        if tool_name and tool_name in self.explicit_parameter_mappings:
-            tool_mappings = self.explicit_parameter_mappings[tool_name]
-            for param_name, param_value in params.items():
-                if param_name in tool_mappings and tool_mappings[param_name] == required_param:
-                    corrected_params = params.copy()
-                    corrected_params[required_param] = param_value
-                    corrected_params.pop(param_name)
-
-                    return ParameterCorrection(
-                        original_params=params,
-                        corrected_params=corrected_params,
-                        transformation_applied=f"Tool-specific mapping: '{param_name}' → '{required_param}'",
-                        confidence=0.9
-                    )
-
-        # Check universal mappings
-        for param_name, param_value in params.items():
-            if param_name in self.universal_parameter_mappings and self.universal_parameter_mappings[param_name] == required_param:
-                corrected_params = params.copy()
-                corrected_params[required_param] = param_value
-                corrected_params.pop(param_name)
+        if tool_name and tool_name in _INVERSE_EXPLICIT_MAPPINGS:
+            sources = _INVERSE_EXPLICIT_MAPPINGS[tool_name].get(required_param)
+            # The first matching name in the incoming parameters' order wins
+            param_name = next((name for name in params if name in sources), None) if sources else None
+            if param_name is not None:
+                corrected_params = _rename_key(params, param_name, required_param, params[param_name])
 
                 return ParameterCorrection(
                     original_params=params,
                     corrected_params=corrected_params,
-                    transformation_applied=f"Universal mapping: '{param_name}' → '{required_param}'",
-                    confidence=0.8
+                    transformation_applied=f"Tool-specific mapping: '{param_name}' → '{required_param}'",
+                    confidence=0.9
                 )
 
+        # Check universal mappings
+        sources = _INVERSE_UNIVERSAL_MAPPINGS.get(required_param)
+        param_name = next((name for name in params if name in sources), None) if sources else None
+        if param_name is not None:
+            corrected_params = _rename_key(params, param_name, required_param, params[param_name])
+
+            return ParameterCorrection(
+                original_params=params,
+                corrected_params=corrected_params,
+                transformation_applied=f"Universal mapping: '{param_name}' → '{required_param}'",
+                confidence=0.8
+            )
+
         return None
 
-    def _missing_parameter_defaults_transform(self, error_message: str, params: Dict[str, Any], tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
+    def _missing_parameter_defaults_transform(self, error_message: str, params: Dict[str, Any], features: _ErrorFeatures, tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
         """Add default values for missing required parameters"""
+        required_param = features.required_param
 
-        # Extract the required parameter name from the error message
-        path_match = re.search(r'"path":\s*\[\s*"([^"]+)"\s*\]', error_message)
-        if not path_match:
+        if required_param is None:
             return None
 
-        required_param = path_match.group(1)
-
         # Check if parameter is already present
         if required_param in params:
             return None
 
         # Check tool-specific defaults
-        if tool_name and tool_name in self.default_parameter_values:
-            tool_defaults = self.default_parameter_values[tool_name]
+        if tool_name and tool_name in _DEFAULT_VALUES:
+            tool_defaults = _DEFAULT_VALUES[tool_name]
             if required_param in tool_defaults:
                 corrected_params = params.copy()
 
                 # For missing parameters that need values from existing parameters
                 if required_param == "search_term" and "query" in params:
                     corrected_params[required_param] = params["query"]
-                elif required_param == "symbol" and any(key in params for key in ["ticker", "stock", "asset"]):
-                    for key in ["ticker", "stock", "asset"]:
-                        if key in params:
-                            corrected_params[required_param] = params[key]
-                            break
+                elif required_param == "symbol" and params.keys() & _SYMBOL_SOURCES:
+                    source = next(key for key in _SYMBOL_SOURCES if key in params)
+                    corrected_params[required_param] = params[source]
                 else:
                     # Use default value
                     corrected_params[required_param] = tool_defaults[required_param]
@@ -224,25 +312,22 @@ class MCPParameterCorrector:
 
         return None
 
-    def _string_to_array_transform(self, error_message: str, params: Dict[str, Any], tool_name: str = None) -> Optional[ParameterCorrection]:
+    def _string_to_array_transform(self, error_message: str, params: Dict[str, Any], features: _ErrorFeatures, tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
         """Transform string parameters to arrays when MCP expects arrays"""
+        required_param = features.required_param
         
         # Look for "expected array, received string" or similar patterns
-        if "array" in error_message.lower() and ("string" in error_message.lower() or "undefined" in error_message.lower()):
-            # Extract the parameter name from path in error message
-            path_match = re.search(r'"path":\s*\[\s*"([^"]+)"\s*\]', error_message)
-            if path_match:
-                expected_param = path_match.group(1)
-                
+        if features.mentions_array and features.mentions_string:
+            # Parameter name from the path in the error message
+            expected_param = required_param
+            if expected_param is not None:
+                expected_lower = expected_param.lower()
                 # Look for similar parameter in original params
                 for param_name, param_value in params.items():
-                    if param_name.lower() in expected_param.lower() or expected_param.lower() in param_name.lower():
+                    param_lower = param_name.lower()
+                    if param_lower in expected_lower or expected_lower in param_lower:
                         # Convert string to array
-                        corrected_params = params.copy()
-                        corrected_params[expected_param] = [param_value] if param_value is not None else []
-                        # Remove the old parameter
-                        if param_name != expected_param:
-                            corrected_params.pop(param_name, None)
+                        corrected_params = _rename_key(params, param_name, expected_param, [param_value] if param_value is not None else [])
                         
                         return ParameterCorrection(
                             original_params=params,
@@ -253,113 +338,111 @@ class MCPParameterCorrector:
         
         return None
     
-    def _singular_to_plural_transform(self, error_message: str, params: Dict[str, Any], tool_name: str = None) -> Optional[ParameterCorrection]:
+    def _singular_to_plural_transform(self, error_message: str, params: Dict[str, Any], features: _ErrorFeatures, tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
         """Transform singular parameter names to plural when needed"""
         
         # Extract expected and received parameter names
-        matches = re.findall(r'"([^"]+)"', error_message)
-        if len(matches) >= 2:
-            expected = matches[0]
-            for param_name in params.keys():
-                if param_name.rstrip('s') == expected.rstrip('s') and param_name != expected:
-                    # Found a singular/plural mismatch
-                    corrected_params = params.copy()
-                    corrected_params[expected] = params[param_name]
-                    corrected_params.pop(param_name)
-                    
-                    return ParameterCorrection(
-                        original_params=params,
-                        corrected_params=corrected_params,
-                        transformation_applied=f"Renamed '{param_name}' to '{expected}'",
-                        confidence=0.7
-                    )
+        quoted = _QUOTED_RE.finditer(error_message)
+        first, second = next(quoted, None), next(quoted, None)
+        if first and second:
+            expected = first.group(1)
+            stem = expected.rstrip('s')
+            param_name = next((name for name in params if name != expected and name.rstrip('s') == stem), None)
+            if param_name is not None:
+                # Found a singular/plural mismatch
+                corrected_params = _rename_key(params, param_name, expected, params[param_name])
+                
+                return ParameterCorrection(
+                    original_params=params,
+                    corrected_params=corrected_params,
+                    transformation_applied=f"Renamed '{param_name}' to '{expected}'",
+                    confidence=0.7
+                )
         
         return None
     
-    def _snake_to_camel_transform(self, error_message: str, params: Dict[str, Any], tool_name: str = None) -> Optional[ParameterCorrection]:
+    def _snake_to_camel_transform(self, error_message: str, params: Dict[str, Any], features: _ErrorFeatures, tool_name: str = None, user_message: str = None) -> Optional[ParameterCorrection]:
         """Transform snake_case to camelCase or vice versa"""
         
-        # Look for parameter name mismatches involving underscores
-        param_pattern = r'"([^"]*_[^"]*)"'
-        matches = re.findall(param_pattern, error_message)
+        # Parameter names with underscores dropped and case folded, built on the first candidate
+        folded = None
         
-        for expected_param in matches:
-            for param_name in params.keys():
-                # Check if this could be a case conversion issue
-                if (param_name.replace('_', '').lower() == expected_param.replace('_', '').lower() and 
-                    param_name != expected_param):
-                    
-                    corrected_params = params.copy()
-                    corrected_params[expected_param] = params[param_name]
-                    corrected_params.pop(param_name)
-                    
-                    return ParameterCorrection(
-                        original_params=params,
-                        corrected_params=corrected_params,
-                        transformation_applied=f"Converted '{param_name}' to '{expected_param}'",
-                        confidence=0.6
-                    )
+        # Look for parameter name mismatches involving underscores, stopping at the first rename
+        for match in _SNAKE_RE.finditer(error_message):
+            if folded is None:
+                # Every name per folded key, in parameter order, so e.g. both foo_bar and fooBar are seen
+                folded = {}
+                for param_name in params:
+                    folded.setdefault(param_name.replace('_', '').lower(), []).append(param_name)
+            
+            expected_param = match.group(1)
+            # Check if this could be a case conversion issue; the first other spelling wins
+            candidates = folded.get(expected_param.replace('_', '').lower(), ())
+            param_name = next((name for name in candidates if name != expected_param), None)
+            if param_name is not None:
+                corrected_params = _rename_key(params, param_name, expected_param, params[param_name])
+                
+                return ParameterCorrection(
+                    original_params=params,
+                    corrected_params=corrected_params,
+                    transformation_applied=f"Converted '{param_name}' to '{expected_param}'",
+                    confidence=0.6
+                )
         
         return None
     
-    def _handle_specific_patterns(self, error_message: str, params: Dict[str, Any]) -> Optional[ParameterCorrection]:
+    def _handle_specific_patterns(self, error_message: str, params: Dict[str, Any], required_field: Optional[str]) -> Optional[ParameterCorrection]:
         """Handle specific known error patterns"""
         
+        if "Required" not in error_message or required_field is None:
+            return None
+        required_clean = _normalize_name(required_field)
+        
+        # Normalize parameter names once, keeping parameter order; names that normalize alike
+        # (e.g. foo_bar and foo-bar) stay separate and the first match wins
+        normalized = [(_normalize_name(param_name), param_name) for param_name in params]
+        
         # Handle array requirements in general
-        if "Required" in error_message and "array" in error_message:
-            # Try to extract the required field name
-            path_match = re.search(r'"path":\s*\[\s*"([^"]+)"\s*\]', error_message)
-            if path_match:
-                required_field = path_match.group(1)
+        if "array" in error_message:
+            # Look for a similar parameter that could be converted
+            param_name = next(
+                (param_name for param_clean, param_name in normalized
+                 if param_clean in required_clean or required_clean in param_clean),
+                None
+            )
+            if param_name is not None:
+                param_value = params[param_name]
+                if not isinstance(param_value, list):
+                    param_value = [param_value] if param_value is not None else []
+                corrected_params = _rename_key(params, param_name, required_field, param_value)
                 
-                # Look for a similar parameter that could be converted
-                for param_name, param_value in params.items():
-                    if (param_name.lower().replace('_', '') in required_field.lower().replace('_', '') or
-                        required_field.lower().replace('_', '') in param_name.lower().replace('_', '')):
-                        
-                        corrected_params = params.copy()
-                        if isinstance(param_value, list):
-                            corrected_params[required_field] = param_value
-                        else:
-                            corrected_params[required_field] = [param_value] if param_value is not None else []
-                        
-                        if param_name != required_field:
-                            corrected_params.pop(param_name, None)
-                        
-                        return ParameterCorrection(
-                            original_params=params,
-                            corrected_params=corrected_params,
-                            transformation_applied=f"Converted '{param_name}' to required '{required_field}' array",
-                            confidence=0.7
-                        )
+                return ParameterCorrection(
+                    original_params=params,
+                    corrected_params=corrected_params,
+                    transformation_applied=f"Converted '{param_name}' to required '{required_field}' array",
+                    confidence=0.7
+                )
         
         # Handle general missing required parameters by looking for fuzzy matches
-        if "Required" in error_message and "undefined" in error_message:
-            path_match = re.search(r'"path":\s*\[\s*"([^"]+)"\s*\]', error_message)
-            if path_match:
-                required_field = path_match.group(1)
+        if "undefined" in error_message:
+            # Check if one is contained in the other or they share significant overlap
+            required_chars = frozenset(required_clean)
+            min_overlap = min(3, len(required_clean) // 2)
+            param_name = next(
+                (param_name for param_clean, param_name in normalized
+                 if param_clean in required_clean or required_clean in param_clean
+                 or len(required_chars.intersection(param_clean)) >= min_overlap),
+                None
+            )
+            if param_name is not None:
+                corrected_params = _rename_key(params, param_name, required_field, params[param_name])
                 
-                # Look for parameters with similar names
-                for param_name, param_value in params.items():
-                    # Check for partial matches, case-insensitive
-                    param_clean = param_name.lower().replace('_', '').replace('-', '')
-                    required_clean = required_field.lower().replace('_', '').replace('-', '')
-                    
-                    # Check if one is contained in the other or they share significant overlap
-                    if (param_clean in required_clean or required_clean in param_clean or
-                        len(set(param_clean) & set(required_clean)) >= min(3, len(required_clean) // 2)):
-                        
-                        corrected_params = params.copy()
-                        corrected_params[required_field] = param_value
-                        if param_name != required_field:
-                            corrected_params.pop(param_name, None)
-                        
-                        return ParameterCorrection(
-                            original_params=params,
-                            corrected_params=corrected_params,
-                            transformation_applied=f"Renamed '{param_name}' to required '{required_field}'",
-                            confidence=0.6
-                        )
+                return ParameterCorrection(
+                    original_params=params,
+                    corrected_params=corrected_params,
+                    transformation_applied=f"Renamed '{param_name}' to required '{required_field}'",
+                    confidence=0.6
+                )
         
         return None
 
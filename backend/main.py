@@ -1,14 +1,71 @@
+import asyncio
+import logging
+import logging.handlers
+import os
+import queue
 from contextlib import asynccontextmanager
+import anyio.to_thread
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
+from fastapi.responses import ORJSONResponse
+from app.api.routes import router, clear_llm_services
 from app.core.database import Database
 from app.services.local_mcp_manager import local_mcp_manager
+from app.services.mcp_client import mcp_client
+from app.services.llm_service import close_http_client
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """Send app.* logs through a queue so stream writes happen on a listener thread, not the event loop"""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    
+    app_logger = logging.getLogger("app")
+    app_logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    app_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    app_logger.propagate = False
+    return logging.handlers.QueueListener(log_queue, stream_handler)
+
+log_listener = configure_logging()
+
+_CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"*"),
+    (b"access-control-allow-headers", b"*"),
+]
+_PREFLIGHT_HEADERS = _CORS_HEADERS + [(b"access-control-max-age", b"600")]
+
+class PermissiveCORSMiddleware:
+    """Allow-all CORS for development/workshop environments: fixed headers, no per-request origin matching"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        
+        # Answer preflights directly
+        if scope["method"] == "OPTIONS" and any(name == b"access-control-request-method" for name, _ in scope["headers"]):
+            await send({"type": "http.response.start", "status": 204, "headers": _PREFLIGHT_HEADERS})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *_CORS_HEADERS]
+            await send(message)
+        
+        await self.app(scope, receive, send_with_cors)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    db = Database()
+    log_listener.start()
+    # Sync endpoints and offloaded DB calls share this pool; keep it roomy so they don't queue
+    anyio.to_thread.current_default_thread_limiter().total_tokens = int(os.environ.get("THREADPOOL_SIZE", "100"))
+    # Schema setup and migrations do file IO; keep them off the event loop
+    db = await asyncio.to_thread(Database)
+    app.state.db = db
     print("Database initialized successfully")
     
     # Verify and cleanup any orphaned MCP server processes
@@ -19,24 +76,24 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     print("Shutting down application, stopping all MCP servers...")
-    local_mcp_manager.shutdown_all()
+    await local_mcp_manager.shutdown_all()
     print("All MCP servers stopped")
+    await mcp_client.close()
+    clear_llm_services()
+    await close_http_client()
+    db.close()
+    log_listener.stop()
 
 app = FastAPI(
     title="Simple MCP Client API",
     description="Backend API for the Simple MCP Client application",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 # Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for development/workshop environments
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+app.add_middleware(PermissiveCORSMiddleware)  # Allow all origins for development/workshop environments
 
 # Include API routes
 app.include_router(router, prefix="/api")
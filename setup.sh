@@ -32,11 +32,15 @@ echo "📋 Checking prerequisites..."
 # Check Python
 if ! command_exists python3; then
     echo "❌ Python 3 is required but not installed."
-    echo "Please install Python 3.8+ and try again."
+    echo "Please install Python 3.9+ and try again."
     exit 1
 fi
 
 PYTHON_VERSION=$(python3 --version | cut -d' ' -f2)
+if ! python3 -c 'import sys; sys.exit(sys.version_info < (3, 9))'; then
+    echo "❌ Python 3.9+ is required (found $PYTHON_VERSION)."
+    exit 1
+fi
 echo "✅ Python $PYTHON_VERSION found"
 
 # Check Node.js